@@ -0,0 +1,8 @@
+"""
+zogn 的基准测试
+
+    python -m benchmarks generate /tmp/site --posts 1000
+    python -m benchmarks run --posts 500 --output result.json
+    python -m benchmarks run --posts 500 --baseline baseline.json --threshold 0.15
+    python -m benchmarks compare baseline.json result.json
+"""
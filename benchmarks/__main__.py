@@ -0,0 +1,170 @@
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+import click
+
+from benchmarks.compare import compare, format_table, load_results
+from benchmarks.sitegen import generate_site
+from benchmarks.suite import measure, summarize
+
+RESULTS_VERSION = 1
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+ZOGN = [sys.executable, "-c", "from zogn.main import cli; cli()"]
+
+# 命令行冷启动的时间上限（秒），启动时加载文章或导入渲染依赖都会超过它
+STARTUP_LIMIT = 0.5
+# 只有具体命令用到时才能导入的模块
+HEAVY_MODULES = ("flask", "werkzeug", "PIL", "feedgen", "mistune", "markdown", "numpy", "scipy")
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(REPO_ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def _run(args, cwd):
+    subprocess.run(args, cwd=cwd, env=_env(), check=True, stdout=subprocess.DEVNULL)
+
+
+def heavy_imports(site):
+    """
+    在站点目录中导入命令行入口，返回已经被导入的重量级模块
+    """
+    code = ("import sys; from zogn.main import cli; "
+            f"print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], cwd=site, env=_env(), check=True,
+                            stdout=subprocess.PIPE, text=True)
+    return result.stdout.split()
+
+
+def check_startup(results, modules, limit):
+    """
+    命令行冷启动超过 limit 秒，或导入入口时就导入了重量级模块时失败
+    """
+    errors = []
+    startup = results["cli.startup"]["min"]
+    if startup > limit:
+        errors.append(f"命令行启动耗时 {startup * 1000:.0f}ms，超过上限 {limit * 1000:.0f}ms")
+    if modules:
+        errors.append(f"导入 zogn.main 时导入了 {', '.join(modules)}")
+    if errors:
+        raise click.ClickException("；".join(errors))
+
+
+def run_commands(site, repeat):
+    """
+    以子进程运行命令行，包括 Python 启动和模块导入的时间
+    """
+    results = {}
+
+    def bench(name, args, setup=None):
+        results[name] = summarize(measure(lambda: _run(args, site), repeat, setup))
+        click.echo(f"{name:<36}{results[name]['min'] * 1000:>10.1f}ms", err=True)
+
+    def clean():
+        shutil.rmtree(site / "docs", ignore_errors=True)
+        shutil.rmtree(site / ".zogn-cache", ignore_errors=True)
+        for path in (site / "img").glob("**/*.webp"):
+            path.unlink()
+
+    bench("cli.startup", ZOGN + ["--help"])
+    bench("build.cold", ZOGN + ["build", "-j", "1"], setup=clean)
+    bench("build.warm", ZOGN + ["build", "-j", "1"])
+    bench("build.incremental", ZOGN + ["build", "--incremental", "-j", "1"])
+    return results
+
+
+@click.group()
+def cli():
+    pass
+
+
+@cli.command("generate", short_help="生成基准测试站点")
+@click.argument("root", type=click.Path(file_okay=False))
+@click.option("--posts", default=200)
+@click.option("--tags", default=30)
+@click.option("--categories", default=8)
+@click.option("--dailies", default=50)
+@click.option("--images", default=10)
+@click.option("--seed", default=1)
+def generate_command(root, posts, tags, categories, dailies, images, seed):
+    generate_site(root, posts=posts, tags=tags, categories=categories, dailies=dailies, images=images, seed=seed)
+    click.echo(f"已生成 {root}")
+
+
+@cli.command("run", short_help="运行基准测试")
+@click.option("--posts", default=200)
+@click.option("--repeat", default=5, help="每项重复次数，取最小值比较")
+@click.option("--site", type=click.Path(file_okay=False), default=None, help="站点目录，默认使用临时目录")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="结果写入的 JSON 文件")
+@click.option("--baseline", type=click.Path(exists=True, dir_okay=False), default=None, help="与基线比较")
+@click.option("--threshold", default=0.1, help="比基线慢超过该比例时失败")
+@click.option("--max-startup", default=STARTUP_LIMIT, help="命令行冷启动超过该秒数时失败，0 为不检查")
+def run_command(posts, repeat, site, output, baseline, threshold, max_startup):
+    tmp = None
+    if site is None:
+        tmp = tempfile.mkdtemp(prefix="zogn-bench-")
+        site = Path(tmp, "site")
+    site = Path(site)
+    generate_site(site, posts=posts, dailies=max(1, posts // 4))
+
+    try:
+        suite = subprocess.run([sys.executable, "-m", "benchmarks.suite", "--repeat", str(repeat)], cwd=site,
+                               env=_env(), check=True, stdout=subprocess.PIPE)
+        results = json.loads(suite.stdout)
+        results.update(run_commands(site, repeat))
+        modules = heavy_imports(site) if max_startup else []
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+    data = {
+        "version": RESULTS_VERSION,
+        "meta": {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "posts": posts,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        click.echo(f"结果已写入 {output}")
+    if baseline:
+        _check(load_results(baseline), data, threshold)
+    if max_startup:
+        check_startup(results, modules, max_startup)
+
+
+@cli.command("compare", short_help="比较两次结果")
+@click.argument("baseline", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", default=0.1, help="比基线慢超过该比例时失败")
+def compare_command(baseline, current, threshold):
+    _check(load_results(baseline), load_results(current), threshold)
+
+
+def _check(baseline, current, threshold):
+    if baseline["meta"].get("posts") != current["meta"].get("posts"):
+        click.echo("警告：两次结果的文章数量不同", err=True)
+    rows, regressions = compare(baseline, current, threshold)
+    click.echo(format_table(rows, regressions))
+    if regressions:
+        raise click.ClickException(f"{len(regressions)} 项比基线慢 {threshold:.0%} 以上")
+
+
+if __name__ == "__main__":
+    cli()
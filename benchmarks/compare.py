@@ -0,0 +1,36 @@
+"""
+比较两次基准测试的结果
+"""
+import json
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1, min_delta=0.001):
+    """
+    返回 (所有条目, 变慢超过阈值的条目)，每个条目为 (名称, 基线耗时, 本次耗时, 比值)
+
+    按每项的最小耗时比较，差值小于 min_delta 秒的视为噪声
+    """
+    rows, regressions = [], []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["min"] / base["min"] if base["min"] else float("inf")
+        row = (name, base["min"], result["min"], ratio)
+        rows.append(row)
+        if ratio > 1 + threshold and result["min"] - base["min"] > min_delta:
+            regressions.append(row)
+    return rows, regressions
+
+
+def format_table(rows, regressions):
+    lines = [f"{'名称':<36}{'基线(ms)':>12}{'本次(ms)':>12}{'比值':>8}"]
+    for name, base, current, ratio in rows:
+        mark = "  <- 变慢" if (name, base, current, ratio) in regressions else ""
+        lines.append(f"{name:<36}{base * 1000:>12.1f}{current * 1000:>12.1f}{ratio:>8.2f}{mark}")
+    return "\n".join(lines)
@@ -0,0 +1,199 @@
+"""
+生成用于基准测试的站点，相同参数生成的内容完全相同
+"""
+import random
+import shutil
+from datetime import date, timedelta
+from pathlib import Path
+
+SETTINGS = '''\
+SITE_NAME = "Benchmark"
+SITE_URL = "https://bench.example.com"
+SITE_DESCRIPTION = "zogn benchmark site"
+SITE_KEYWORDS = "zogn,benchmark"
+STATIC_FOLDER = "bench/static"
+TEMPLATES_FOLDER = "bench/templates"
+PAGINATION_NUM = 10
+LINKS = [["zogn", "https://github.com/Cocojcc/zogn"]]
+'''
+
+# 仓库中没有内置主题，这里是一个覆盖所有页面的精简主题
+TEMPLATES = {
+    "base.html": """<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <title>{% block title %}{{ SITE_NAME }}{% endblock %}</title>
+    <link rel="stylesheet" href="{{ asset_url('css/style.css') }}">
+  </head>
+  <body>
+    <nav>
+      {% for c in total.category %}<a href="/category/{{ c.name }}">{{ c.name }} ({{ c.count }})</a>
+      {% endfor %}
+    </nav>
+    <main>{% block body %}{% endblock %}</main>
+    <aside>
+      <ul>
+        {% for t in total.tag %}<li><a href="/tag/{{ t.name }}">{{ t.name }}</a> {{ t.count }}</li>
+        {% endfor %}
+      </ul>
+      <ul>
+        {% for a in recently %}<li><a href="{{ a.url }}">{{ a.title }}</a></li>
+        {% endfor %}
+      </ul>
+    </aside>
+    <script src="{{ asset_url('js/app.js') }}"></script>
+  </body>
+</html>
+""",
+    "list.html": """{% extends "base.html" %}
+{% block body %}
+  {% for a in articles %}
+  <article>
+    <h2><a href="{{ a.url }}">{{ a.title }}</a></h2>
+    <div>{{ a.abstract }}</div>
+    {% for t in a.tags %}<a href="{{ t.url }}">{{ t.name }}</a>{% endfor %}
+  </article>
+  {% endfor %}
+  {% if page %}
+    {% if page.has_prev %}<a href="{{ page.prev_page_path }}">上一页</a>{% endif %}
+    {% if page.has_next %}<a href="{{ page.next_page_path }}">下一页</a>{% endif %}
+  {% endif %}
+{% endblock %}
+""",
+    "post/detail.html": """{% extends "base.html" %}
+{% block title %}{{ article.title }}{% endblock %}
+{% block body %}
+  <h1>{{ article.title }}</h1>
+  <div>{{ article.body }}</div>
+  {% if article.prev_article %}<a href="/{{ article.prev_article.slug }}">{{ article.prev_article.title }}</a>{% endif %}
+  {% if article.next_article %}<a href="/{{ article.next_article.slug }}">{{ article.next_article.title }}</a>{% endif %}
+{% endblock %}
+""",
+    "archives.html": """{% extends "base.html" %}
+{% block body %}
+  {% for month, items in archives.items() %}
+  <h3>{{ month }}</h3>
+  <ul>{% for a in items %}<li><a href="{{ a.url }}">{{ a.title }}</a></li>{% endfor %}</ul>
+  {% endfor %}
+{% endblock %}
+""",
+    "tags.html": """{% extends "base.html" %}
+{% block body %}{% for t in tags %}<a href="/tag/{{ t.name }}">{{ t.name }} ({{ t.count }})</a>{% endfor %}{% endblock %}
+""",
+    "about.html": """{% extends "base.html" %}
+{% block body %}{{ body }}{% endblock %}
+""",
+    "links.html": """{% extends "base.html" %}
+{% block body %}{% for name, url in LINKS %}<a href="{{ url }}">{{ name }}</a>{% endfor %}{% endblock %}
+""",
+    "sitemap.xml": """<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+{% for a in articles %}<url><loc>{{ SITE_URL }}{{ a.url }}</loc><lastmod>{{ a.date }}</lastmod></url>
+{% endfor %}{% for t in tags %}<url><loc>{{ SITE_URL }}{{ t.url }}</loc></url>
+{% endfor %}{% for c in categories %}<url><loc>{{ SITE_URL }}{{ c.url }}</loc></url>
+{% endfor %}</urlset>
+""",
+}
+TEMPLATES["index.html"] = TEMPLATES["post/category.html"] = TEMPLATES["post/tag.html"] = TEMPLATES["list.html"]
+
+STATIC = {
+    "css/style.css": "body {\n  margin: 0 auto;\n  max-width: 48rem;\n}\n\n/* 代码块 */\npre {\n  overflow: auto;\n}\n",
+    "js/app.js": "// 代码高亮\nfunction highlight(el) {\n  return el.classList.add('hl');\n}\n",
+}
+
+WORDS = ("static site generator markdown template render cache index build server python "
+         "博客 静态 生成 模板 渲染 缓存 索引 构建 预览 文章").split()
+
+
+def _paragraph(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _body(rng, number, images):
+    parts = [f"# 第 {number} 篇\n"]
+    for i in range(rng.randint(4, 16)):
+        parts.append(_paragraph(rng, rng.randint(20, 80)))
+        if i % 4 == 1:
+            parts.append(f"## 小节 {i}\n\n- {_paragraph(rng, 5)}\n- {_paragraph(rng, 5)}\n- `inline {i}`")
+        if i % 5 == 2:
+            parts.append(f"```python\ndef func_{i}(x):\n    # {_paragraph(rng, 4)}\n    return x * {i}\n```")
+        if images and i % 6 == 3:
+            parts.append(f"![图片 {i}](/img/bench-{rng.randrange(images)}.png)")
+    return "\n\n".join(parts) + "\n"
+
+
+def _write_images(root, count):
+    try:
+        from PIL import Image
+    except ImportError:
+        return
+    for i in range(count):
+        image = Image.new("RGB", (320, 200), ((i * 37) % 256, (i * 91) % 256, (i * 53) % 256))
+        image.save(root / f"bench-{i}.png")
+
+
+def generate_site(root, posts=200, tags=30, categories=8, dailies=50, images=10, drafts=0.05, seed=1):
+    """
+    在 root 下生成站点：posts 篇文章、dailies 篇日志、images 张引用图片，约 drafts 比例的文章为草稿
+    """
+    root = Path(root)
+    if root.exists():
+        shutil.rmtree(root)
+    rng = random.Random(seed)
+
+    theme = root / "themes" / "bench"
+    for name, text in TEMPLATES.items():
+        path = theme / "templates" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    for name, text in STATIC.items():
+        path = theme / "static" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    (root / "settings.toml").write_text(SETTINGS, encoding="utf-8")
+
+    img = root / "img"
+    img.mkdir(parents=True)
+    _write_images(img, images)
+
+    content = root / "content"
+    (content / "post").mkdir(parents=True)
+    (content / "daily").mkdir(parents=True)
+    (content / "about.md").write_text(f"# 关于\n\n{_paragraph(rng, 60)}\n", encoding="utf-8")
+
+    tag_names = [f"tag-{i}" for i in range(tags)]
+    category_names = [f"category-{i}" for i in range(categories)]
+    start = date(2020, 1, 1)
+    for i in range(posts):
+        day = start + timedelta(days=rng.randrange(1500))
+        status = "draft" if rng.random() < drafts else "publish"
+        post_tags = rng.sample(tag_names, min(len(tag_names), rng.randint(1, 4)))
+        folder = content / "post" / str(day.year)
+        folder.mkdir(exist_ok=True)
+        (folder / f"post-{i}.md").write_text(
+            "---\n"
+            f"title: 基准测试文章 {i}\n"
+            f"slug: post-{i}\n"
+            f"date: {day.isoformat()}\n"
+            f"category: {rng.choice(category_names)}\n"
+            f"tags: [{', '.join(post_tags)}]\n"
+            f"status: {status}\n"
+            "---\n\n" + _body(rng, i, images),
+            encoding="utf-8")
+
+    for i in range(dailies):
+        day = start + timedelta(days=i)
+        folder = content / "daily" / day.strftime("%Y")
+        folder.mkdir(exist_ok=True)
+        (folder / f"{day:%Y%m%d}.md").write_text(
+            "---\n"
+            f"title: {day:%Y年%m月%d日}\n"
+            f"slug: daily-{day:%Y%m%d}\n"
+            f"date: {day.isoformat()}\n"
+            "category: 日常\n"
+            "tags: []\n"
+            "status: publish\n"
+            "---\n\n" + _paragraph(rng, 40) + "\n",
+            encoding="utf-8")
+    return root
@@ -0,0 +1,119 @@
+"""
+在站点目录中运行的基准测试，zogn.conf 在导入时读取当前目录，因此由 run 命令在子进程中执行：
+
+    python -m benchmarks.suite --repeat 5
+"""
+import argparse
+import json
+import shutil
+import statistics
+import sys
+import time
+
+
+def measure(func, repeat, setup=None):
+    """
+    执行 func repeat 次，返回每次的耗时（秒），setup 在每次执行前调用且不计时
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times):
+    return {"min": min(times), "median": statistics.median(times), "runs": len(times)}
+
+
+def run_suite(repeat):
+    from zogn import conf, builders, parsers
+    from zogn.assets import build_assets
+    from zogn.images import build_images
+
+    results = {}
+
+    def bench(name, func, setup=None, times=repeat):
+        results[name] = summarize(measure(func, times, setup))
+        print(f"{name:<36}{results[name]['min'] * 1000:>10.1f}ms", file=sys.stderr)
+
+    # Markdown 渲染，不经过渲染缓存
+    sources = []
+    for path in sorted(conf.POST_PATH.rglob("*.md"))[:50]:
+        with path.open("r", encoding="utf-8") as f:
+            sources.append(parsers.parse_markdown(f)[1])
+    bench("content2markdown", lambda: [parsers.content2markdown(s) for s in sources])
+
+    def clear_render_cache():
+        shutil.rmtree(conf.CACHE_PATH, ignore_errors=True)
+
+    conf.CACHE_ENABLED = True
+    bench("load_all_data.cold", lambda: parsers.load_all_data(1), setup=clear_render_cache)
+    bench("load_all_data.cached", lambda: parsers.load_all_data(1))
+
+    # 各构建函数在当前进程中串行渲染，不使用增量构建和写入清单
+    build_assets()
+    articles = conf.POST_DATA["articles"]
+    conf.HTML_OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
+    for func, args in [
+        (builders.build_article, (articles,)),
+        (builders.build_sitemap, (articles,)),
+        (builders.build_category, (articles,)),
+        (builders.build_tags, (articles,)),
+        (builders.build_all_tags, (articles,)),
+        (builders.build_index, (articles,)),
+        (builders.build_rss, (articles,)),
+        (builders.build_archives, (articles,)),
+        (builders.build_static, ()),
+        (builders.build_links, ()),
+        (builders.build_about, ()),
+    ]:
+        bench(func.__name__, lambda: func(*args))
+
+    def clear_images():
+        for path in conf.IMAGE_PATH.glob("**/*.webp"):
+            path.unlink()
+        manifest = conf.CACHE_PATH / "images.json"
+        if manifest.exists():
+            manifest.unlink()
+
+    bench("build_images.cold", lambda: build_images(articles, 1), setup=clear_images)
+    bench("build_images.cached", lambda: build_images(articles, 1))
+
+    # 预览服务器，分别测试首次渲染和命中响应缓存
+    from zogn import server
+
+    server.load_site(1)
+    client = server.app.test_client()
+    index = conf.SITE_INDEX
+    routes = {
+        "index": "/",
+        "detail": articles[len(articles) // 2]["url"],
+        "category": f"/category/{next(iter(index.categories))}",
+        "tag": f"/tag/{next(iter(index.tags))}",
+        "archives": "/archives",
+        "sitemap": "/sitemap.xml",
+    }
+    for name, url in routes.items():
+        def get(url=url):
+            response = client.get(url)
+            assert response.status_code == 200, (url, response.status_code)
+
+        bench(f"server.{name}.cold", get, setup=server.response_cache.clear)
+        bench(f"server.{name}.cached", get)
+
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+    json.dump(run_suite(args.repeat), sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from zogn import conf
+from zogn.compress import ENCODING_SUFFIXES
+from zogn.outputs import atomic_write
+
+# 修改压缩方式时需要递增，使旧的压缩缓存失效
+MINIFIER_REVISION = 1
+ASSET_FOLDERS = ("css", "js")
+
+# 源文件路径（相对 static 目录）-> 带哈希的文件路径，由 build_assets 填充
+ASSET_MANIFEST = {}
+
+
+def asset_url(path):
+    """
+    模板中引用静态文件，构建后返回带内容哈希的地址，例如 {{ asset_url("css/style.css") }}
+    """
+    path = path.lstrip("/")
+    if path.startswith("static/"):
+        path = path[len("static/"):]
+    return "/static/" + ASSET_MANIFEST.get(path, path)
+
+
+def minify(suffix, text):
+    if suffix == ".css":
+        from csscompressor import compress
+        return compress(text)
+    if suffix == ".js":
+        from rjsmin import jsmin
+        return jsmin(text)
+    return text
+
+
+def hashed_name(rel, data):
+    digest = hashlib.sha256(data).hexdigest()[:10]
+    stem, suffix = os.path.splitext(rel)
+    return f"{stem}.{digest}{suffix}"
+
+
+class AssetPipeline:
+    """
+    压缩主题中的 CSS/JS 并生成带内容哈希的文件名，压缩结果按源文件哈希缓存
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = Path(cache_path)
+        self.used = set()
+
+    def _minified(self, source, suffix):
+        data = source.read_bytes()
+        key = hashlib.sha256(data + f"\0{MINIFIER_REVISION}".encode()).hexdigest()
+        cached = self.cache_path.joinpath(key + suffix)
+        self.used.add(cached.name)
+        try:
+            return cached.read_bytes()
+        except OSError:
+            pass
+
+        output = minify(suffix, data.decode("utf-8")).encode("utf-8")
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        atomic_write(cached, output)
+        return output
+
+    def build(self, static_folder, output_folder):
+        manifest = {}
+        produced = set()
+        for folder in ASSET_FOLDERS:
+            origin = Path(static_folder, folder)
+            for root, dirs, files in os.walk(origin):
+                for file in files:
+                    source = Path(root, file)
+                    rel = source.relative_to(static_folder).as_posix()
+                    suffix = source.suffix.lower()
+                    if suffix in (".css", ".js"):
+                        data = self._minified(source, suffix)
+                        outputs = [rel, hashed_name(rel, data)]
+                        manifest[rel] = outputs[1]
+                    else:
+                        data = source.read_bytes()
+                        outputs = [rel]
+
+                    for output in outputs:
+                        target = Path(output_folder, output)
+                        produced.add(target)
+                        target.parent.mkdir(parents=True, exist_ok=True)
+                        write_if_changed(target, data)
+
+        # 删除旧版本的文件，保留预压缩生成的 .gz/.br，原文件已删除的由 Precompressor 清理
+        kept = produced | {target.with_name(target.name + suffix)
+                           for target in produced for suffix in ENCODING_SUFFIXES.values()}
+        for folder in ASSET_FOLDERS:
+            for root, dirs, files in os.walk(Path(output_folder, folder)):
+                for file in files:
+                    path = Path(root, file)
+                    if path not in kept:
+                        path.unlink()
+
+        self.prune()
+        return manifest
+
+    def prune(self):
+        if not self.cache_path.exists():
+            return
+        for cached in self.cache_path.iterdir():
+            if cached.name not in self.used:
+                cached.unlink()
+
+
+def write_if_changed(path, data):
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    with open(path, "wb") as f:
+        f.write(data)
+    return True
+
+
+def build_assets():
+    """
+    构建静态资源，并把清单写入 static/manifest.json 供模板和部署使用
+    """
+    output_folder = conf.HTML_OUTPUT_PATH.joinpath("static")
+    pipeline = AssetPipeline(conf.CACHE_PATH / "assets")
+    manifest = pipeline.build(conf.STATIC_FOLDER, output_folder)
+
+    output_folder.mkdir(parents=True, exist_ok=True)
+    data = json.dumps(manifest, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+    write_if_changed(output_folder.joinpath("manifest.json"), data)
+
+    ASSET_MANIFEST.clear()
+    ASSET_MANIFEST.update(manifest)
+    return manifest
@@ -1,19 +1,51 @@
 import datetime
-import shutil
+import io
+import pickle
 import os
-from csscompressor import compress
-from copy import deepcopy
-from pathlib import Path
-
-import dateutil.tz
-from feedgen.feed import FeedGenerator
-from jinja2 import Environment, FileSystemLoader
-
-from zogn import conf
-
-from zogn.parsers import parse_category, parse_tag, MyMarkdown, content2markdown, POST_DATA
-
-env = Environment(loader=FileSystemLoader(conf.THEME_PATH / conf.TEMPLATES_FOLDER))
+import time
+import traceback
+from collections import ChainMap
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from jinja2 import FileSystemLoader
+from jinja2.sandbox import ImmutableSandboxedEnvironment
+
+from zogn import conf, profiling
+
+from zogn.assets import asset_url, ASSET_MANIFEST
+from zogn.cache import template_cache
+from zogn.compress import TEXT_SUFFIXES
+from zogn.depends import post_key, abstract_key, meta_key
+from zogn.htmlmin import minify_html
+from zogn.outputs import atomic_write, AtomicStream
+from zogn.sync import sync_file, sync_files
+from zogn.parsers import get_site_index, content2markdown, POST_DATA
+
+# 所有页面共享同一份站点数据，模板中不允许修改列表、字典等可变对象
+env = ImmutableSandboxedEnvironment(loader=FileSystemLoader(conf.THEME_PATH / conf.TEMPLATES_FOLDER),
+                                    bytecode_cache=template_cache())
+env.globals["asset_url"] = asset_url
+
+# 增量构建时由 build 命令设置为 DependencyGraph
+build_graph = None
+# 并行渲染时由 build 命令设置为 RenderQueue，页面先入队，最后由进程池统一渲染
+render_queue = None
+# 由 build 命令设置为 OutputManifest，内容没有变化的页面不再写入
+output_manifest = None
+
+# 由 build 命令在开启预压缩时设置，页面写入时同时写入这些压缩文件
+stream_encodings = ()
+
+# 页面数量少于该值时直接在当前进程渲染
+PARALLEL_RENDER_THRESHOLD = 200
+# 逐块写入页面时每攒够这么多块编码写入一次，模板生成的块大多只有几十个字符
+STREAM_BATCH_SIZE = 512
+
+# 本次构建写入的 HTML 压缩前后的字节数
+minify_stats = {"original": 0, "written": 0}
+# 当前进程是否为渲染进程池中的子进程
+_in_worker = False
 
 
 def copy_img_files(source_folder, destination_folder):
@@ -36,34 +68,42 @@ def copy_img_files(source_folder, destination_folder):
 
 
 def build_article(articles):
+    path_prefix = conf.HTML_OUTPUT_PATH.joinpath(conf.POST_HTML_FOLDER_NAME)
+    path_prefix.mkdir(parents=True, exist_ok=True)
     for article in articles:
-        html = render_to_html("post/detail.html", article=article)
-        path_prefix = conf.HTML_OUTPUT_PATH.joinpath(conf.POST_HTML_FOLDER_NAME)
-        path_prefix.mkdir(parents=True, exist_ok=True)
         save_path = path_prefix.joinpath(article["slug"] + ".html")
-        writer(save_path, html)
+        deps = [post_key(article)]
+        for neighbour in ("prev_article", "next_article"):
+            if article.get(neighbour):
+                deps.append(f"meta:{article[neighbour]['slug']}")
+        write_page(save_path, "post/detail.html", deps, article=article)
 
 
 def build_category(articles):
-    category_dict = parse_category(articles)
+    category_dict = get_site_index(articles).categories
     path_prefix = conf.HTML_OUTPUT_PATH.joinpath("category")
     path_prefix.mkdir(parents=True, exist_ok=True)
     pagination_num = conf.PAGINATION_NUM
     for category_name, articles in category_dict.items():
         paginator = Pagination(articles, pagination_num, page_tag=category_name, page_suffix="category")
         page_count = paginator.page_count
+        pages_key = f"pages:category:{category_name}"
+        if build_graph is not None:
+            build_graph.add_source(pages_key, page_count)
 
         for i in range(1, page_count + 1):
-            html = render_to_html("post/category.html", articles=paginator.paginate(i), category_name=category_name, page=paginator)
+            page_articles = paginator.paginate(i)
             if i == 1:
                 save_path = path_prefix.joinpath(f"{category_name}.html")
             else:
                 save_path = path_prefix.joinpath(f"{category_name}-page-{i}.html")
-            writer(save_path, html)
+            deps = [pages_key, *map(abstract_key, page_articles)]
+            write_page(save_path, "post/category.html", deps, articles=page_articles, category_name=category_name,
+                       page=paginator)
 
 
 def build_tags(articles):
-    tags_dict = parse_tag(articles)
+    tags_dict = get_site_index(articles).tags
     path_prefix = conf.HTML_OUTPUT_PATH.joinpath("tag")
     path_prefix.mkdir(parents=True, exist_ok=True)
     pagination_num = conf.PAGINATION_NUM
@@ -71,127 +111,92 @@ def build_tags(articles):
     for tag_name, articles in tags_dict.items():
         paginator = Pagination(articles, pagination_num, page_tag=tag_name, page_suffix="tag")
         page_count = paginator.page_count
+        pages_key = f"pages:tag:{tag_name}"
+        if build_graph is not None:
+            build_graph.add_source(pages_key, page_count)
 
         for i in range(1, page_count + 1):
-            html = render_to_html("post/tag.html", articles=paginator.paginate(i), tag_name=tag_name, page=paginator)
+            page_articles = paginator.paginate(i)
             if i == 1:
                 save_path = path_prefix.joinpath(f"{tag_name}.html")
             else:
                 save_path = path_prefix.joinpath(f"{tag_name}-page-{i}.html")
-            writer(save_path, html)
+            deps = [pages_key, *map(abstract_key, page_articles)]
+            write_page(save_path, "post/tag.html", deps, articles=page_articles, tag_name=tag_name, page=paginator)
 
 
 def build_all_tags(articles):
-    tags = parse_tag(articles)
+    tags = get_site_index(articles).tags
     tags = [{"name": name, "count": len(articles)} for name, articles in tags.items()]
-    html = render_to_html("tags.html", tags=tags)
     save_path = conf.HTML_OUTPUT_PATH.joinpath("tags.html")
-    writer(save_path, html)
+    write_page(save_path, "tags.html", [], tags=tags)
 
 
 def build_about():
+    save_path = conf.HTML_OUTPUT_PATH.joinpath("about.html")
+    if build_graph is not None and not build_graph.needs_build(save_path, ["file:about.md"], "about.html"):
+        return
     about_path = conf.CONTENT_PATH / "about.md"
     with open(about_path, "r", encoding="utf-8") as f:
         body = content2markdown(f.read())
-    html = render_to_html("about.html", body=body)
-    save_path = conf.HTML_OUTPUT_PATH.joinpath("about.html")
-    writer(save_path, html)
+    _record_sizes(write_rendered(save_path, "about.html", {"body": body})[0])
 
 
 def build_links():
-    html = render_to_html("links.html")
     save_path = conf.HTML_OUTPUT_PATH.joinpath("links.html")
-    writer(save_path, html)
+    write_page(save_path, "links.html", [])
 
 
 def build_sitemap(articles):
-    article_tags = []
-    [article_tags.append(tag) for article in articles for tag in article["tags"] if tag not in article_tags]
-    categories = []
-    [categories.append(article["category"]) for article in articles if article["category"] not in categories]
+    index = get_site_index(articles)
+    article_tags = index.tag_list
+    categories = index.category_list
     today = datetime.date.today()
 
-    html = render_to_html("sitemap.xml", articles=articles, tags=article_tags, categories=categories,
-                          today=today)
     save_path = conf.HTML_OUTPUT_PATH.joinpath("sitemap.xml")
-    writer(save_path, html)
+    write_page(save_path, "sitemap.xml", [*map(meta_key, articles), f"date:{today}"], articles=articles,
+               tags=article_tags, categories=categories, today=today)
 
 
 def build_static():
-    # static = conf.HTML_OUTPUT_PATH.joinpath("static")
-    # if static.exists():
-    #     shutil.rmtree(static)
-    # shutil.copytree(conf.STATIC_FOLDER, static)
-
-    # CSS file
-    output_static = conf.HTML_OUTPUT_PATH.joinpath("static", "css")
-    origin_static = conf.STATIC_FOLDER.joinpath("css")
-
-    # 遍历源文件夹中的所有文件和子文件夹
-    for root, dirs, files in os.walk(origin_static):
-        # 构建目标文件夹中的相对路径
-        destination_path = os.path.join(output_static, os.path.relpath(root, origin_static))
-
-        # 确保目标文件夹中的子文件夹存在，如果不存在则创建
-        if not os.path.exists(destination_path):
-            os.makedirs(destination_path)
-
-        # 复制文件到目标文件夹
-        for file in files:
-            source_file_path = os.path.join(root, file)
-            destination_file_path = os.path.join(destination_path, file)
-            css = compress(open(source_file_path, "r", encoding="utf8").read())
-            writer(destination_file_path, css)
-
-    # JS file
-    js_static = conf.HTML_OUTPUT_PATH.joinpath("static", "js")
-    if js_static.exists():
-        shutil.rmtree(js_static)
-    shutil.copytree(conf.STATIC_FOLDER.joinpath("js"), js_static)
-
-    # image file
-    img = conf.HTML_OUTPUT_PATH.joinpath("img")
-    if img.exists():
-        shutil.rmtree(img)
-
-    for file in conf.IMAGE_PATH.glob("**/*.webp"):
-        output_index = file.parts.index("img")
-        relative_path = Path(*file.parts[output_index:])
-        target_path = conf.HTML_OUTPUT_PATH.joinpath(relative_path)
-        os.makedirs(os.path.dirname(target_path), exist_ok=True)
-        shutil.copy2(file, target_path)
-
-    # shutil.copytree(conf.IMAGE_PATH, img)
-    # copy_img_files(conf.IMAGE_PATH, img)
-
-    # ico file
-    ico_file = conf.STATIC_FOLDER.joinpath("favicon.ico")
-    if ico_file.exists():
-        shutil.copy2(ico_file, conf.HTML_OUTPUT_PATH)
-
-    robots = conf.STATIC_FOLDER.joinpath("robots.txt")
-    if robots.exists():
-        shutil.copy2(robots, conf.HTML_OUTPUT_PATH)
+    # CSS、JS 由 build_assets 处理
+
+    # image file，只同步新增或变化的图片，并删除源目录中已不存在的图片
+    img = conf.HTML_OUTPUT_PATH.joinpath(conf.IMAGE_FOLDER_NAME)
+    pairs = [(file, img.joinpath(file.relative_to(conf.IMAGE_PATH))) for file in conf.IMAGE_PATH.glob("**/*.webp")]
+    sync_files(pairs, img)
+
+    # ico file, robots.txt，主题中已删除时同时删除输出目录中的文件
+    for name in ("favicon.ico", "robots.txt"):
+        source = conf.STATIC_FOLDER.joinpath(name)
+        target = conf.HTML_OUTPUT_PATH.joinpath(name)
+        if source.exists():
+            sync_file(source, target)
+        elif target.exists():
+            target.unlink()
 
 
 def build_index(articles):
     pagination_num = conf.PAGINATION_NUM
     paginator = Pagination(articles, pagination_num, page_tag="index")
     page_count = paginator.page_count
+    pages_key = "pages:index"
+    if build_graph is not None:
+        build_graph.add_source(pages_key, page_count)
 
     for i in range(1, page_count + 1):
-        html = render_to_html("index.html", articles=paginator.paginate(i), page=paginator)
+        page_articles = paginator.paginate(i)
         if i == 1:
             save_path = conf.HTML_OUTPUT_PATH.joinpath("index.html")
         else:
             save_path = conf.HTML_OUTPUT_PATH.joinpath(f"index-page-{i}.html")
-        writer(save_path, html)
+        deps = [pages_key, *map(abstract_key, page_articles)]
+        write_page(save_path, "index.html", deps, articles=page_articles, page=paginator)
 
 
 def build_archives(articles):
-    html = render_to_html("archives.html", articles=articles)
     save_path = conf.HTML_OUTPUT_PATH.joinpath("archives.html")
-    writer(save_path, html)
+    write_page(save_path, "archives.html", list(map(meta_key, articles)), articles=articles)
 
 
 class Pagination:
@@ -258,41 +263,251 @@ def build_rss(articles):
     """
     生成 RSS Feed
     """
-    articles = deepcopy(articles)
+    save_path = conf.HTML_OUTPUT_PATH.joinpath('feed.xml')
+    if build_graph is not None and not build_graph.needs_build(save_path, list(map(post_key, articles))):
+        return None
+
+    import dateutil.tz
+    from feedgen.feed import FeedGenerator
 
     fg = FeedGenerator()
     fg.id(conf.SITE_SETTINGS.get("SITE_URL"))
     fg.title(conf.SITE_SETTINGS.get("SITE_NAME"))
     fg.link(href=conf.SITE_SETTINGS.get("SITE_URL"), rel='alternate')
     fg.description(conf.SITE_SETTINGS.get('SITE_DESCRIPTION'))
-    articles.sort(key=lambda x: x["date"], reverse=False)
+    articles = sorted(articles, key=lambda x: x["date"], reverse=False)
     for index, item in enumerate(articles):
         fe = fg.add_entry()
         fe.id(str(item['slug']))
         fe.title(item['title'])
-        fe.pubDate(datetime.datetime.combine(item['date'], datetime.datetime.min.time(), tzinfo=dateutil.tz.tzutc()))
+        pub_date = datetime.datetime.combine(item['date'], datetime.datetime.min.time(), tzinfo=dateutil.tz.tzutc())
+        fe.pubDate(pub_date)
+        # 使用最新文章的日期，文章没有变化时 feed.xml 内容不变
+        fg.lastBuildDate(pub_date)
         fe.content(item['body'])
         fe.link(href=f"{conf.SITE_SETTINGS.get('SITE_URL')}{item['url']}")
-    fg.rss_file(conf.HTML_OUTPUT_PATH.joinpath('feed.xml').as_posix())
+    # 直接写入文件，不生成包含所有文章正文的字符串
+    with open_stream(save_path) as stream:
+        fg.rss_file(stream)
     return fg
 
 
-def render_to_html(template, **kwargs):
+def render_stream(template, post_data=None, **kwargs):
+    """
+    逐块生成渲染结果，不拼接完整的页面；逐块写入时计时包括写入文件
+    """
     template = env.get_template(template)
+    post_data = POST_DATA if post_data is None else post_data
+
+    # 按页面参数、站点数据、站点配置的顺序查找变量，不复制共享的站点数据
+    context = template.new_context(ChainMap(kwargs, post_data, conf.SITE_SETTINGS, template.globals), shared=True)
+    if profiling.profiler is not None:
+        wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield from template.root_render_func(context)
+    except Exception:
+        env.handle_exception()
+    if profiling.profiler is not None:
+        profiling.profiler.record("template", template.name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def render_to_html(template, post_data=None, **kwargs):
+    return env.concat(render_stream(template, post_data, **kwargs))
+
+
+def write_page(save_path, template, deps, **kwargs):
+    """
+    渲染模板并写入文件，增量构建时跳过依赖没有变化的页面
+    """
+    if build_graph is not None and not build_graph.needs_build(save_path, deps, template):
+        return
+    if render_queue is not None:
+        render_queue.put(save_path, template, kwargs)
+        return
+    _record_sizes(write_rendered(save_path, template, kwargs)[0])
+
+
+def write_rendered(save_path, template, kwargs):
+    """
+    渲染模板并逐块写入文件，峰值内存与页面大小无关，返回 ((压缩前字节数, 写入字节数), 内容哈希)
+
+    开启 MINIFY_HTML 时压缩需要完整的页面，仍先拼接再写入
+    """
+    if conf.MINIFY_HTML and str(save_path).endswith(".html"):
+        return write_html(save_path, render_to_html(template, **kwargs))
+    digest, size = stream_writer(save_path, render_stream(template, **kwargs))
+    return (size, size), digest
+
+
+def write_html(save_path, html):
+    """
+    写入渲染后的页面，开启 MINIFY_HTML 时先压缩 HTML，返回 ((压缩前字节数, 写入字节数), 内容哈希)
+    """
+    original = written = len(html.encode("utf-8"))
+    if conf.MINIFY_HTML and str(save_path).endswith(".html"):
+        html = minify_html(html)
+        written = len(html.encode("utf-8"))
+    digest = writer(save_path, html)
+    return (original, written), digest
+
 
-    post_data = deepcopy(POST_DATA)
-    post_data.update(**kwargs)
+def _record_sizes(sizes):
+    minify_stats["original"] += sizes[0]
+    minify_stats["written"] += sizes[1]
 
-    html = template.render(**conf.SITE_SETTINGS, **post_data)
-    return html
+
+class _JobPickler(pickle.Pickler):
+    """
+    序列化页面任务时，把 POST_DATA 中的文章替换为下标引用
+    """
+
+    def __init__(self, file, refs):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.refs = refs
+
+    def persistent_id(self, obj):
+        return self.refs.get(id(obj))
+
+
+class _JobUnpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        return POST_DATA["articles"][pid]
+
+
+def _init_render_worker(post_data, site_settings, asset_manifest, minify, manifest, encodings, profile,
+                        cache_enabled):
+    global output_manifest, stream_encodings, _in_worker
+
+    # 每个工作进程只接收一次站点数据
+    output_manifest = manifest
+    stream_encodings = encodings
+    _in_worker = True
+    profiling.profiler = None
+    if profile:
+        import tracemalloc
+
+        # 内存峰值只统计主进程
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        profiling.profiler = profiling.Profiler()
+    POST_DATA.clear()
+    POST_DATA.update(post_data)
+    conf.SITE_SETTINGS.update(site_settings)
+    ASSET_MANIFEST.update(asset_manifest)
+    conf.MINIFY_HTML = minify
+    # spawn/forkserver 启动的工作进程重新导入模块，--no-cache 需要在这里重新生效
+    conf.CACHE_ENABLED = cache_enabled
+    if not cache_enabled:
+        env.bytecode_cache = None
+
+
+def _render_job(payload):
+    save_path = None
+    try:
+        save_path, template, kwargs = _JobUnpickler(io.BytesIO(payload)).load()
+        sizes, digest = write_rendered(save_path, template, kwargs)
+    except Exception:
+        return save_path, traceback.format_exc(), (0, 0), None, None
+    # 子进程中的计时随结果返回给主进程
+    stats = profiling.profiler.drain() if _in_worker and profiling.profiler is not None else None
+    return save_path, None, sizes, digest, stats
+
+
+class RenderQueue:
+    """
+    收集待渲染的页面，由进程池并行渲染并写入，每个任务只返回输出路径、错误信息、写入的字节数和内容哈希
+    """
+
+    def __init__(self, jobs=None):
+        self.jobs = jobs or os.cpu_count() or 1
+        self.refs = {id(article): index for index, article in enumerate(POST_DATA.get("articles", []))}
+        self.payloads = []
+
+    def put(self, save_path, template, kwargs):
+        # 入队时立即序列化，保存 Pagination 等对象当前的状态
+        buf = io.BytesIO()
+        _JobPickler(buf, self.refs).dump((str(save_path), template, kwargs))
+        self.payloads.append(buf.getvalue())
+
+    def flush(self):
+        payloads, self.payloads = self.payloads, []
+        if self.jobs > 1 and len(payloads) >= PARALLEL_RENDER_THRESHOLD:
+            chunksize = max(1, len(payloads) // (self.jobs * 8))
+            with ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_render_worker,
+                                     initargs=(dict(POST_DATA), dict(conf.SITE_SETTINGS),
+                                               dict(ASSET_MANIFEST), conf.MINIFY_HTML,
+                                               output_manifest, stream_encodings,
+                                               profiling.profiler is not None,
+                                               conf.CACHE_ENABLED)) as executor:
+                results = list(executor.map(_render_job, payloads, chunksize=chunksize))
+        else:
+            results = list(map(_render_job, payloads))
+
+        for path, _, sizes, digest, stats in results:
+            _record_sizes(sizes)
+            if stats is not None:
+                profiling.profiler.merge(stats)
+            # 在子进程中写入的页面，由主进程记录到清单
+            if output_manifest is not None and digest is not None:
+                output_manifest.add(path, digest)
+        errors = [(path, error) for path, error, *_ in results if error is not None]
+        if errors:
+            path, error = errors[0]
+            raise RuntimeError(f"{len(errors)} 个页面渲染失败，{path}：\n{error}")
+        return len(results)
 
 
 def writer(filepath, html):
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(html)
+    """
+    原子写入文件，构建时内容与上次相同的页面不再写入，返回内容哈希
+    """
+    data = html.encode("utf-8")
+    if profiling.profiler is not None:
+        wall, cpu = time.perf_counter(), time.process_time()
+    digest = None
+    if output_manifest is not None and output_manifest.owns(filepath):
+        digest = output_manifest.write(filepath, data)
+    else:
+        atomic_write(filepath, data)
+    if profiling.profiler is not None:
+        profiling.profiler.record("write", os.path.splitext(str(filepath))[1] or "-",
+                                  time.perf_counter() - wall, time.process_time() - cpu)
+    return digest
+
+
+def _encode_chunks(chunks):
+    chunks = iter(chunks)
+    while True:
+        batch = list(islice(chunks, STREAM_BATCH_SIZE))
+        if not batch:
+            return
+        yield "".join(batch).encode("utf-8")
+
+
+def open_stream(filepath):
+    """
+    打开输出文件用于逐块写入，构建时内容与上次相同的文件不再替换，开启预压缩时同时写入压缩文件
+    """
+    encodings = stream_encodings if str(filepath).endswith(TEXT_SUFFIXES) else ()
+    if output_manifest is not None and output_manifest.owns(filepath):
+        return output_manifest.open(filepath, encodings)
+    return AtomicStream(filepath, encodings=encodings)
+
+
+def stream_writer(filepath, chunks):
+    """
+    与 writer 相同，内容由 chunks 逐块给出，返回 (内容哈希, 字节数)
+    """
+    with open_stream(filepath) as stream:
+        for data in _encode_chunks(chunks):
+            stream.write(data)
+    return stream.result
 
 
 def read_md(path):
+    from zogn.renderers import MyMarkdown
+
     with open(path, "r") as f:
         md = MyMarkdown(extensions=[
             'markdown.extensions.extra',
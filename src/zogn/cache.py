@@ -0,0 +1,118 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+from jinja2 import FileSystemBytecodeCache
+
+from zogn import conf
+from zogn.outputs import atomic_write
+
+
+class RenderCache:
+    """
+    持久化的渲染缓存，以内容哈希为键，每个条目一个 JSON 文件
+    """
+
+    def __init__(self, path, max_size):
+        self.path = Path(path)
+        self.max_size = max_size
+
+    @staticmethod
+    def make_key(*parts):
+        h = hashlib.sha256()
+        for part in parts:
+            h.update(str(part).encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return self.path.joinpath(key[:2], f"{key}.json")
+
+    def get(self, key):
+        entry = self._entry_path(key)
+        try:
+            with entry.open("r", encoding="utf-8") as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 更新修改时间，淘汰时按最近使用排序
+        try:
+            os.utime(entry)
+        except OSError:
+            pass
+        return value
+
+    def set(self, key, value):
+        entry = self._entry_path(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(entry, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def prune(self):
+        """
+        超出容量上限时，按最近使用时间淘汰旧条目
+        """
+        if not self.path.exists():
+            return 0
+
+        entries = []
+        total = 0
+        for p in self.path.glob("*/*.json"):
+            try:
+                stat = p.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+            total += stat.st_size
+
+        removed = 0
+        if total <= self.max_size:
+            return removed
+
+        entries.sort(key=lambda x: x[0])
+        for _, size, p in entries:
+            if total <= self.max_size:
+                break
+            try:
+                p.unlink()
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        if self.path.exists():
+            shutil.rmtree(self.path)
+
+
+class TemplateBytecodeCache(FileSystemBytecodeCache):
+    """
+    模板编译结果的持久化缓存，Jinja 按模板源码的校验和判断缓存是否失效
+
+    缓存目录被删除（例如执行 zogn cache clear）时自动重新创建，写入失败不影响渲染
+    """
+
+    def dump_bytecode(self, bucket):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            super().dump_bytecode(bucket)
+        except OSError:
+            pass
+
+
+render_cache = RenderCache(conf.CACHE_PATH / "render", conf.CACHE_MAX_SIZE)
+
+
+def template_cache():
+    if not conf.CACHE_ENABLED:
+        return None
+    return TemplateBytecodeCache(str(conf.TEMPLATE_CACHE_PATH))
+
+
+def clear_all():
+    if conf.CACHE_PATH.exists():
+        shutil.rmtree(conf.CACHE_PATH)
+    if conf.TEMPLATE_CACHE_PATH.exists():
+        shutil.rmtree(conf.TEMPLATE_CACHE_PATH)
@@ -0,0 +1,207 @@
+import gzip
+import hashlib
+import json
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+MANIFEST_VERSION = 1
+TEXT_SUFFIXES = (".html", ".xml", ".css", ".js", ".json", ".txt", ".svg")
+# 小于该大小的文件压缩收益很小
+MIN_SIZE = 256
+
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+# 逐块读取和压缩文件，不把整个文件读入内存
+CHUNK_SIZE = 64 * 1024
+
+
+def available_encodings():
+    """
+    可用的压缩方式，按优先级排列，brotli 为可选依赖
+    """
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return ("gzip",)
+    return ("br", "gzip")
+
+
+def compress_bytes(data, encoding):
+    if encoding == "br":
+        import brotli
+        return brotli.compress(data, quality=11)
+    # mtime 固定为 0，相同内容得到相同的压缩结果
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compressor(encoding):
+    """
+    分块压缩，返回 (压缩一块, 结束) 两个函数，预压缩文件都由它生成，相同内容得到相同的结果
+    """
+    if encoding == "br":
+        import brotli
+        obj = brotli.Compressor(quality=11)
+        return obj.process, obj.finish
+    # wbits=31 输出 gzip 格式，头部的修改时间为 0
+    obj = zlib.compressobj(9, zlib.DEFLATED, 31)
+    return obj.compress, obj.flush
+
+
+def is_fresh(path, variant):
+    """
+    压缩文件不比原文件旧时视为与原文件一致
+    """
+    try:
+        return os.stat(variant).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def remove_variants(path, keep=()):
+    """
+    删除 path 的 .gz/.br，keep 中的压缩方式除外
+    """
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        if encoding in keep:
+            continue
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def remove_stale_variants(root):
+    """
+    删除原文件已删除、或比原文件旧的压缩文件，返回删除的数量
+
+    不开启预压缩的构建也要执行，否则支持预压缩的服务器会返回修改前的内容
+    """
+    suffixes = tuple(ENCODING_SUFFIXES.values())
+    removed = 0
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(suffixes):
+                continue
+            path = os.path.join(dirpath, filename)
+            if not is_fresh(os.path.splitext(path)[0], path):
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def choose_encoding(accept_encoding, available):
+    """
+    根据 Accept-Encoding 从 available 中选择压缩方式，都不接受时返回 None
+    """
+    accepted = {}
+    for item in (accept_encoding or "").split(","):
+        parts = item.strip().split(";")
+        name = parts[0].strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name] = q
+
+    for encoding in available:
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def _compress_file(args):
+    path, encodings = args
+    for encoding in encodings:
+        target = path + ENCODING_SUFFIXES[encoding]
+        tmp = f"{target}.{os.getpid()}.tmp"
+        process, finish = compressor(encoding)
+        with open(path, "rb") as src, open(tmp, "wb") as f:
+            for block in iter(lambda: src.read(CHUNK_SIZE), b""):
+                f.write(process(block))
+            f.write(finish())
+        os.replace(tmp, target)
+    return path
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Precompressor:
+    """
+    为输出目录中的文本文件生成 .gz 和 .br，内容哈希未变化且压缩文件存在时跳过，
+    内容变化但压缩文件已在渲染时同时写入（不比原文件旧）时也跳过
+    """
+
+    def __init__(self, manifest_path, jobs=None):
+        self.manifest_path = Path(manifest_path)
+        self.jobs = jobs or os.cpu_count() or 1
+        self.encodings = available_encodings()
+        self.hashes = {}
+        try:
+            with self.manifest_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.hashes = data["hashes"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def run(self, root):
+        root = Path(root)
+        pending = []
+        hashes = {}
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                if filename.endswith(tuple(ENCODING_SUFFIXES.values())):
+                    # 原文件已删除时同时删除压缩文件
+                    if not os.path.exists(os.path.splitext(path)[0]):
+                        os.remove(path)
+                    continue
+                if not filename.endswith(TEXT_SUFFIXES):
+                    continue
+                if os.path.getsize(path) < MIN_SIZE:
+                    for suffix in ENCODING_SUFFIXES.values():
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                    continue
+
+                digest = file_hash(path)
+                rel = Path(path).relative_to(root).as_posix()
+                hashes[rel] = digest
+                if self.hashes.get(rel) == digest:
+                    stale = [e for e in self.encodings if not os.path.exists(path + ENCODING_SUFFIXES[e])]
+                else:
+                    # 渲染时已经同时写入的压缩文件不比原文件旧，不需要重新压缩
+                    stale = [e for e in self.encodings if not is_fresh(path, path + ENCODING_SUFFIXES[e])]
+                if stale:
+                    pending.append((path, stale))
+
+        if self.jobs > 1 and len(pending) > 1:
+            chunksize = max(1, len(pending) // (self.jobs * 4))
+            with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                list(executor.map(_compress_file, pending, chunksize=chunksize))
+        else:
+            list(map(_compress_file, pending))
+
+        self.hashes = hashes
+        self.save()
+        return len(pending), len(hashes) - len(pending)
+
+    def save(self):
+        # outputs 依赖本模块，在这里导入避免循环导入
+        from zogn.outputs import atomic_write
+
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.manifest_path, json.dumps({"version": MANIFEST_VERSION, "hashes": self.hashes}).encode("utf-8"))
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 import toml
 from datetime import date
@@ -10,6 +11,7 @@ POST_SOURCE_FOLDER_NAME = "post"
 HTML_FOLDER_NAME = "docs"
 THEME_FOLDER_NAME = "themes"
 IMAGE_FOLDER_NAME = "img"
+CACHE_FOLDER_NAME = ".zogn-cache"
 
 POST_HTML_FOLDER_NAME = ""
 
@@ -19,6 +21,7 @@ DAILY_PATH = CONTENT_PATH / DAILY_FOLDER_NAME
 HTML_OUTPUT_PATH = BASE_DIR / HTML_FOLDER_NAME
 THEME_PATH = BASE_DIR / THEME_FOLDER_NAME
 IMAGE_PATH = BASE_DIR / IMAGE_FOLDER_NAME
+CACHE_PATH = BASE_DIR / CACHE_FOLDER_NAME
 
 DEFAULT_POST_TEMPLATE = """\n
 ---
@@ -54,6 +57,30 @@ STATIC_FOLDER = THEME_PATH.joinpath(settings.get("STATIC_FOLDER", ""))
 TEMPLATES_FOLDER = THEME_PATH.joinpath(settings.get("TEMPLATES_FOLDER", ""))
 PAGINATION_NUM = settings.get("PAGINATION_NUM")
 
+# 渲染缓存，可通过 --no-cache 或环境变量 ZOGN_NO_CACHE 关闭
+CACHE_ENABLED = settings.get("CACHE_ENABLED", True) and not os.environ.get("ZOGN_NO_CACHE")
+CACHE_MAX_SIZE = settings.get("CACHE_MAX_SIZE", 256 * 1024 * 1024)
+
+# 模板字节码缓存目录，CI 镜像中可预先执行 zogn theme compile 生成
+TEMPLATE_CACHE_PATH = BASE_DIR.joinpath(settings.get("TEMPLATE_CACHE_PATH", f"{CACHE_FOLDER_NAME}/templates"))
+
+# 生成浏览器端使用的搜索索引，SEARCH_SHARDS 为倒排表的分片数量
+SEARCH_INDEX = settings.get("SEARCH_INDEX", False)
+SEARCH_SHARDS = settings.get("SEARCH_SHARDS", 64)
+
+# 每篇文章的相关文章数量，0 为不计算，需要安装 numpy 和 scipy
+RELATED_POSTS = settings.get("RELATED_POSTS", 0)
+
+# 写入前压缩生成的 HTML
+MINIFY_HTML = settings.get("MINIFY_HTML", False)
+
+# 构建后为文本文件生成 .gz/.br 压缩文件
+PRECOMPRESS = settings.get("PRECOMPRESS", False)
+
+# 图片转换为 WebP 时的质量，IMAGE_WIDTHS 不为空时额外生成对应宽度的图片用于 srcset
+IMAGE_QUALITY = settings.get("IMAGE_QUALITY", 85)
+IMAGE_WIDTHS = sorted(settings.get("IMAGE_WIDTHS", []))
+
 SITE_SETTINGS = {
     "SITE_NAME": settings.get("SITE_NAME"),
     "SITE_LOGO_NAME": settings.get("SITE_LOGO_NAME"),
@@ -71,3 +98,5 @@ SITE_SETTINGS = {
 
 SLUG_TO_PATH = {}
 POST_DATA = {}
+# load_all_data 建立的 parsers.SiteIndex
+SITE_INDEX = None
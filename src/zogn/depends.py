@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from jinja2 import meta, TemplateNotFound
+
+from zogn import conf
+from zogn.compress import remove_variants
+from zogn.outputs import atomic_write
+
+GRAPH_VERSION = 1
+
+# 文章中只在详情页出现的字段，列表页的摘要不依赖它们
+DETAIL_ONLY_FIELDS = ("body", "content", "prev_article", "next_article", "related")
+# 侧边栏、上一篇/下一篇、归档等只用到的字段
+META_FIELDS = ("slug", "title", "url", "date")
+
+
+def fingerprint(value):
+    data = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def post_key(article):
+    return f"post:{article['slug']}"
+
+
+def abstract_key(article):
+    return f"abstract:{article['slug']}"
+
+
+def meta_key(article):
+    return f"meta:{article['slug']}"
+
+
+class DependencyGraph:
+    """
+    记录每个输出页面依赖的数据源及其指纹，增量构建时只重新生成依赖发生变化的页面
+
+    数据源的键形如 ``post:<slug>``、``abstract:<slug>``、``template:<name>``、``settings``，
+    输出页面以相对 HTML_OUTPUT_PATH 的路径记录
+    """
+
+    def __init__(self, path, env, force=True):
+        self.path = Path(path)
+        self.env = env
+        self.force = force
+        self.sources = {}
+        self.outputs = {}
+        self.rebuilt = 0
+        self.skipped = 0
+        self._template_closure = {}
+
+        self.old_sources, self.old_outputs = {}, {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == GRAPH_VERSION:
+                self.old_sources, self.old_outputs = data["sources"], data["outputs"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        # 所有页面共享的依赖
+        self.global_deps = ["settings", "renderer", "sidebar", "assets", "output"]
+
+    def add_source(self, key, value):
+        self.sources[key] = fingerprint(value)
+
+    def collect(self, post_data):
+        """
+        根据已加载的站点数据计算所有数据源的指纹
+        """
+        from zogn.parsers import render_version
+
+        try:
+            settings = conf.CONF_PATH.read_bytes().decode("utf-8")
+        except OSError:
+            settings = ""
+        self.add_source("settings", settings)
+        self.add_source("renderer", render_version())
+
+        articles = post_data.get("articles", [])
+        for article in articles:
+            self.add_source(post_key(article),
+                            {k: v for k, v in article.items() if k not in ("body", "prev_article", "next_article")})
+            self.add_source(abstract_key(article),
+                            {k: v for k, v in article.items() if k not in DETAIL_ONLY_FIELDS})
+            self.add_source(meta_key(article), {k: article.get(k) for k in META_FIELDS})
+
+        # 侧边栏中的分类、标签、归档统计及最近文章，假定模板只使用最近文章的标题和链接
+        self.add_source("sidebar", {
+            "total": post_data.get("total"),
+            "recently": [{k: a.get(k) for k in META_FIELDS} for a in post_data.get("recently", [])],
+        })
+
+        from zogn.assets import ASSET_MANIFEST
+
+        # 静态资源的文件名带有内容哈希，资源变化时所有页面都需要更新引用
+        self.add_source("assets", ASSET_MANIFEST)
+
+        # 命令行参数也会改变输出内容
+        self.add_source("output", {"minify_html": conf.MINIFY_HTML})
+
+        about = conf.CONTENT_PATH / "about.md"
+        self.add_source("file:about.md", about.read_text(encoding="utf-8") if about.exists() else "")
+
+    def template_keys(self, name):
+        """
+        模板及其 extends/include/import 的所有模板
+        """
+        if name in self._template_closure:
+            return self._template_closure[name]
+
+        keys = []
+        pending, seen = [name], set()
+        while pending:
+            current = pending.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            try:
+                source, _, _ = self.env.loader.get_source(self.env, current)
+            except TemplateNotFound:
+                continue
+            key = f"template:{current}"
+            self.add_source(key, source)
+            keys.append(key)
+            for ref in meta.find_referenced_templates(self.env.parse(source)):
+                if ref is not None:
+                    pending.append(ref)
+
+        self._template_closure[name] = keys
+        return keys
+
+    def _relpath(self, output):
+        return Path(output).relative_to(conf.HTML_OUTPUT_PATH).as_posix()
+
+    def needs_build(self, output, deps, template=None):
+        deps = list(self.global_deps) + list(deps)
+        if template:
+            deps.extend(self.template_keys(template))
+        deps = sorted(set(deps))
+
+        rel = self._relpath(output)
+        self.outputs[rel] = deps
+
+        changed = (
+                self.force
+                or self.old_outputs.get(rel) != deps
+                or not os.path.exists(output)
+                or any(self.sources.get(k) != self.old_sources.get(k) for k in deps)
+        )
+        if changed:
+            self.rebuilt += 1
+        else:
+            self.skipped += 1
+        return changed
+
+    def remove_stale(self):
+        """
+        删除上次构建生成、本次不再生成的页面及其压缩文件
+        """
+        removed = 0
+        for rel in self.old_outputs:
+            if rel in self.outputs:
+                continue
+            path = conf.HTML_OUTPUT_PATH.joinpath(rel)
+            if path.exists():
+                path.unlink()
+                removed += 1
+            remove_variants(str(path))
+        return removed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"version": GRAPH_VERSION, "sources": self.sources, "outputs": self.outputs},
+                          ensure_ascii=False)
+        atomic_write(self.path, data.encode("utf-8"))
@@ -0,0 +1,93 @@
+import os
+import pickle
+from pathlib import Path
+
+import yaml
+
+from zogn import conf
+from zogn.outputs import atomic_write
+
+# 安装了 libyaml 时使用 C 实现的解析器，结果与纯 Python 的 FullLoader 相同
+YamlLoader = getattr(yaml, "CFullLoader", yaml.FullLoader)
+
+INDEX_VERSION = 1
+
+
+def load_yaml(text):
+    return yaml.load(text, Loader=YamlLoader) or {}
+
+
+def read_frontmatter(path):
+    """
+    只读取文件开头 --- 之间的元数据，不读取正文
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        if f.readline().strip() != "---":
+            return {}
+        lines = []
+        for line in f:
+            # 与 parsers.parse_markdown 一致，以第一个 --- 作为结束
+            end = line.find("---")
+            if end != -1:
+                lines.append(line[:end])
+                break
+            lines.append(line)
+    return load_yaml("".join(lines))
+
+
+class FrontmatterIndex:
+    """
+    Markdown 文件元数据的持久化索引，文件大小和修改时间都没变时不再读取文件
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = None
+        self.dirty = False
+
+    def _load(self):
+        self.entries = {}
+        if not conf.CACHE_ENABLED:
+            return
+        try:
+            with self.path.open("rb") as f:
+                data = pickle.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.entries = data["entries"]
+        except Exception:
+            pass
+
+    def get(self, path):
+        if self.entries is None:
+            self._load()
+        key = Path(path).as_posix()
+        stat = os.stat(path)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+
+        metadata = read_frontmatter(path)
+        self.entries[key] = (stat.st_size, stat.st_mtime_ns, metadata)
+        self.dirty = True
+        return metadata
+
+    def scan(self, folder):
+        """
+        返回目录下所有 Markdown 文件的 (路径, 元数据)，顺序与 rglob 一致
+        """
+        result = [(p, self.get(p)) for p in Path(folder).rglob("**/*.md")]
+        self.save()
+        return result
+
+    def save(self):
+        if not self.dirty or not conf.CACHE_ENABLED:
+            return
+        # 删除已不存在的文件
+        self.entries = {key: entry for key, entry in self.entries.items() if os.path.exists(key)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, pickle.dumps({"version": INDEX_VERSION, "entries": self.entries},
+                                             protocol=pickle.HIGHEST_PROTOCOL))
+        self.dirty = False
+
+
+frontmatter_index = FrontmatterIndex(conf.CACHE_PATH / "frontmatter.pickle")
@@ -0,0 +1,70 @@
+import re
+
+# 内容需要原样保留的标签
+PRESERVE_TAGS = ("pre", "code", "textarea", "script", "style")
+
+# 块级标签两侧的空白不影响页面显示，可以直接删除
+BLOCK_TAGS = frozenset((
+    "html", "head", "body", "title", "meta", "link", "base", "script", "style", "noscript", "template",
+    "header", "footer", "main", "nav", "section", "article", "aside", "div", "p", "hr", "br", "address",
+    "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li", "dl", "dt", "dd", "figure", "figcaption",
+    "blockquote", "pre", "table", "thead", "tbody", "tfoot", "tr", "th", "td", "caption", "colgroup", "col",
+    "form", "fieldset", "legend", "details", "summary", "dialog", "option", "optgroup", "select",
+    "picture", "source", "video", "audio", "iframe", "svg",
+))
+
+_TOKEN_RE = re.compile(
+    r"(?P<comment><!--.*?-->)"
+    r"|(?P<preserve><(?P<ptag>" + "|".join(PRESERVE_TAGS) + r")\b(?:\"[^\"]*\"|'[^']*'|[^'\">])*>.*?</(?P=ptag)\s*>)"
+    r"|(?P<tag><[a-zA-Z/!?](?:\"[^\"]*\"|'[^']*'|[^'\">])*>)"
+    r"|(?P<text><|[^<]+)",
+    re.DOTALL | re.IGNORECASE,
+)
+_TAG_NAME_RE = re.compile(r"</?([a-zA-Z][a-zA-Z0-9-]*)")
+_SPACE_RE = re.compile(r"\s+")
+
+
+def _is_block(token):
+    """
+    token 是否为块级标签、注释或 doctype 等不参与行内排版的内容
+    """
+    if token is None:
+        return True
+    if not token.startswith("<"):
+        return False
+    match = _TAG_NAME_RE.match(token)
+    if match is None:
+        return token.startswith("<!")
+    return match.group(1).lower() in BLOCK_TAGS
+
+
+def minify_html(html):
+    """
+    压缩 HTML：删除注释（保留条件注释），合并空白，删除块级标签之间的空白
+
+    pre、code、textarea、script、style 的内容及标签属性保持原样
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(html):
+        kind = match.lastgroup
+        token = match.group(0)
+        if kind == "comment" and not token.startswith(("<!--[if", "<!--<![endif]")):
+            continue
+        tokens.append((kind, token))
+
+    output = []
+    for i, (kind, token) in enumerate(tokens):
+        if kind != "text":
+            output.append(token)
+            continue
+
+        prev_token = output[-1] if output else None
+        next_token = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        text = _SPACE_RE.sub(" ", token)
+        if text[:1] == " " and _is_block(prev_token):
+            text = text[1:]
+        if text[-1:] == " " and _is_block(next_token):
+            text = text[:-1]
+        if text:
+            output.append(text)
+    return "".join(output)
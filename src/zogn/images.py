@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from zogn import conf
+from zogn.outputs import atomic_write
+
+MANIFEST_VERSION = 2
+OUTPUT_FORMAT = "WEBP"
+
+
+def is_remote(src):
+    return src.startswith(('http:', 'https:'))
+
+
+def image_output_path(src, width=None):
+    """
+    Markdown 中引用的图片转换后的路径，width 不为空时为对应宽度的缩略图
+    """
+    if is_remote(src):
+        return src
+    suffix = f"-{width}w" if width else ""
+    return f"{os.path.splitext(src)[0]}{suffix}.{OUTPUT_FORMAT.lower()}"
+
+
+def source_width(src):
+    """
+    源图片的宽度，只读取文件头，图片不存在或无法识别时返回 None
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(_site_path(src)) as img:
+            return img.width
+    except Exception:
+        return None
+
+
+def srcset(src, widths):
+    """
+    srcset 的候选 [(地址, 宽度), ...]：比源图片窄的缩略图，最后是与源图片同宽的转换结果，
+    与 ImagePipeline 实际生成的文件一致；源图片的宽度未知时返回空列表
+    """
+    width = source_width(src)
+    if width is None:
+        return []
+    thumbnails = [(image_output_path(src, w), w) for w in sorted(set(widths)) if w < width]
+    return thumbnails + [(image_output_path(src), width)]
+
+
+def image_stats(sources):
+    """
+    图片的大小和修改时间，渲染缓存据此判断 srcset 是否过期
+    """
+    stats = {}
+    for src in sources:
+        try:
+            stat = _site_path(src).stat()
+        except OSError:
+            stats[src] = None
+            continue
+        stats[src] = [stat.st_size, stat.st_mtime_ns]
+    return stats
+
+
+def _file_hash(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _site_path(src):
+    return Path(conf.BASE_DIR.as_posix().strip() + src.strip())
+
+
+class ImagePipeline:
+    """
+    把 Markdown 引用的图片转换为 WebP，可选生成多种宽度供 srcset 使用
+
+    清单中记录每个输出文件对应的源文件哈希和编码参数，源文件或参数变化时重新转换
+    """
+
+    def __init__(self, manifest_path, quality=85, widths=(), jobs=None):
+        self.manifest_path = Path(manifest_path)
+        self.quality = quality
+        self.widths = sorted(set(widths))
+        self.jobs = jobs or os.cpu_count() or 1
+        self.entries = {}
+        try:
+            with self.manifest_path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data["entries"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def params(self, width):
+        return f"{OUTPUT_FORMAT}-q{self.quality}-w{width or 0}"
+
+    def plan(self, sources):
+        """
+        返回需要转换的任务 (源路径, 源文件哈希, 源文件 stat, [(输出路径, 宽度), ...])
+        """
+        tasks = []
+        for src in sorted(set(sources)):
+            if is_remote(src):
+                continue
+            path = _site_path(src)
+            try:
+                stat = path.stat()
+            except OSError:
+                print(f"图片不存在：{src}")
+                continue
+
+            # 大小和修改时间都没变时沿用清单中记录的哈希
+            source_hash = None
+            for width in [None, *self.widths]:
+                entry = self.entries.get(image_output_path(src, width))
+                if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+                    source_hash = entry["hash"]
+                    break
+            if source_hash is None:
+                source_hash = _file_hash(path)
+
+            outputs = []
+            for width in [None, *self.widths]:
+                output = image_output_path(src, width)
+                if output == src:
+                    continue
+                entry = self.entries.get(output)
+                if (entry and entry["hash"] == source_hash and entry["params"] == self.params(width)
+                        and (entry.get("skipped") or _site_path(output).exists())):
+                    continue
+                outputs.append((output, width))
+
+            if outputs:
+                tasks.append((src, source_hash, stat, outputs))
+        return tasks
+
+    def _convert(self, task):
+        from PIL import Image
+
+        src, source_hash, stat, outputs = task
+        skipped = set()
+        try:
+            with Image.open(_site_path(src)) as img:
+                img = img.convert("RGB")
+                for output, width in outputs:
+                    save_path = _site_path(output)
+                    out = img
+                    if width:
+                        # 不小于源图片的宽度不生成缩略图，srcset 中由原图代替
+                        if img.width <= width:
+                            skipped.add(output)
+                            save_path.unlink(missing_ok=True)
+                            continue
+                        out = img.resize((width, round(img.height * width / img.width)), Image.LANCZOS)
+                    tmp = save_path.with_name(f".{save_path.name}.{os.getpid()}.tmp")
+                    out.save(tmp, format=OUTPUT_FORMAT, quality=self.quality)
+                    os.replace(tmp, save_path)
+        except Exception as e:
+            return task, e, skipped
+        return task, None, skipped
+
+    def run(self, sources):
+        tasks = self.plan(sources)
+        if not tasks:
+            return 0
+
+        if self.jobs > 1 and len(tasks) > 1:
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                results = list(executor.map(self._convert, tasks))
+        else:
+            results = list(map(self._convert, tasks))
+
+        converted = 0
+        for (src, source_hash, stat, outputs), error, skipped in results:
+            if error is not None:
+                print(f"图片转换失败 {src}: {error}")
+                continue
+            for output, width in outputs:
+                entry = {"source": src, "hash": source_hash, "size": stat.st_size,
+                         "mtime": stat.st_mtime_ns, "params": self.params(width)}
+                if output in skipped:
+                    entry["skipped"] = True
+                else:
+                    converted += 1
+                self.entries[output] = entry
+        self.save()
+        return converted
+
+    def save(self):
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps({"version": MANIFEST_VERSION, "entries": self.entries}, ensure_ascii=False)
+        atomic_write(self.manifest_path, data.encode("utf-8"))
+
+
+def collect_images(articles):
+    sources = [src for article in articles for src in article.get("images", [])]
+
+    # 关于页面中的图片
+    from zogn.parsers import content2markdown
+
+    about_path = conf.CONTENT_PATH / "about.md"
+    if about_path.exists():
+        with open(about_path, "r", encoding="utf-8") as f:
+            content2markdown(f.read(), images=sources)
+    return sources
+
+
+def build_images(articles, jobs=None):
+    pipeline = ImagePipeline(conf.CACHE_PATH / "images.json", conf.IMAGE_QUALITY, conf.IMAGE_WIDTHS, jobs)
+    return pipeline.run(collect_images(articles))
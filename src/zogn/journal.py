@@ -0,0 +1,104 @@
+import os
+import re
+from datetime import datetime
+
+from zogn import conf
+from zogn.outputs import atomic_write
+
+# 日志的标题行，例如 "2023年05月01日 周一 · 晴 ·" 或 "2023年05月01日 周一"
+meta_pattern = re.compile(r'(\d{4}年\d{2}月\d{2}日)\s(周[一二三四五六日])\s·(.*?)\s·|(\d{4}年\d{2}月\d{2}日)\s(周[一二三四五六日])')
+
+# 每攒够这么多篇日志写入一次
+BATCH_SIZE = 500
+
+
+def iter_entries(lines):
+    """
+    逐行读取导出的日志，每读完一篇就返回 (标题行, 正文)，以行首的标题行分隔
+    """
+    header, body = None, []
+    for line in lines:
+        if meta_pattern.match(line):
+            if header is not None:
+                yield header, "".join(body)
+            header, body = line.rstrip("\n"), []
+        elif header is not None:
+            body.append(line)
+    if header is not None:
+        yield header, "".join(body)
+
+
+def render_entry(header, content):
+    """
+    返回日志文件的路径和内容
+    """
+    daily_date, daily_day, daily_weather, _daily_date, _daily_day = meta_pattern.search(header.strip()).groups()
+    if _daily_day is None:
+        article_date = daily_date
+        article_day = daily_day
+        article_weather = daily_weather
+    else:
+        article_date = _daily_date
+        article_day = _daily_day
+        article_weather = daily_weather
+
+    article_date = datetime.strptime(article_date, "%Y年%m月%d日")
+    daily_title = article_date.strftime("%Y%m%d")
+
+    tmp_str_list = []
+    embedded_data = {"title": daily_title, "slug": daily_title, "category": "日常", "status": "public",
+                     "date": article_date.strftime("%Y-%m-%d"), "day": article_day, "tag": [],
+                     "weather": article_weather if article_weather else ""}
+    for key, val in embedded_data.items():
+        tmp_str_list.append(f"{key}: {val}")
+    meta_str = "\n".join(tmp_str_list)
+    template = conf.DEFAULT_POST_TEMPLATE.format(meta_str).strip()
+    template += "\n" + content
+    parent_folder = conf.DAILY_PATH.joinpath(article_date.strftime("%Y"), article_date.strftime("%Y%m"))
+    return parent_folder.joinpath(f"{daily_title}.md"), template
+
+
+def _file_sizes(folder):
+    try:
+        with os.scandir(folder) as it:
+            return {entry.name: entry.stat().st_size for entry in it if entry.is_file()}
+    except FileNotFoundError:
+        return None
+
+
+def write_entries(entries, stats):
+    """
+    按目录写入一批日志，每个目录只列出一次文件；已有文件内容相同时跳过
+    """
+    folders = {}
+    for path, text in entries:
+        folders.setdefault(path.parent, {})[path] = text.encode("utf-8")
+
+    for folder, files in folders.items():
+        sizes = _file_sizes(folder)
+        if sizes is None:
+            folder.mkdir(parents=True, exist_ok=True)
+            sizes = {}
+        for path, data in files.items():
+            size = sizes.get(path.name)
+            if size == len(data) and path.read_bytes() == data:
+                stats["unchanged"] += 1
+                continue
+            atomic_write(path, data)
+            stats["added" if size is None else "updated"] += 1
+
+
+def import_journal(filepath, batch_size=BATCH_SIZE):
+    """
+    流式导入日志，返回新增、更新和未变化的篇数
+    """
+    stats = {"added": 0, "updated": 0, "unchanged": 0}
+    batch = []
+    with open(filepath, "r", encoding="utf-8") as f:
+        for header, content in iter_entries(f):
+            batch.append(render_entry(header, content))
+            if len(batch) >= batch_size:
+                write_entries(batch, stats)
+                batch = []
+    write_entries(batch, stats)
+    return stats
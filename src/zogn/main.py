@@ -1,20 +1,15 @@
 import os
-import re
 
-from zogn.builders import build_article, build_category, build_about, build_sitemap, writer, build_static, \
-    build_index, build_tags, build_all_tags, build_rss, build_links, build_archives
 import click
-from datetime import date, datetime
-from slugify import slugify
+from datetime import date
 
-from zogn.parsers import check_repeat_slug
-from zogn.server import app
 from zogn import conf
 import functools
+import ipaddress
 import shutil
 
-pattern = r'(\d{4}年\d{2}月\d{2}日\s周[一二三四五六日].*?)\n(.*?)(?=\d{4}年\d{2}月\d{2}日|\Z)'
-meta_pattern = r'(\d{4}年\d{2}月\d{2}日)\s(周[一二三四五六日])\s·(.*?)\s·|(\d{4}年\d{2}月\d{2}日)\s(周[一二三四五六日])'
+# theme compile 编译的模板扩展名
+TEMPLATE_EXTENSIONS = ("html", "xml", "txt")
 
 DAYOFWEEK = {
     "周一": "Mon",
@@ -27,9 +22,6 @@ DAYOFWEEK = {
 }
 
 
-# meta_pattern = r'(\d{4}年\d{2}月\d{2}日)\s(周[一二三四五六日])'
-
-
 def root_command(func):
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
@@ -53,9 +45,50 @@ def cli():
 
 
 @cli.command("build", short_help="构建项目")
+@click.option("--no-cache", is_flag=True, help="不使用渲染缓存")
+@click.option("--incremental", is_flag=True, help="只重新生成依赖发生变化的页面")
+@click.option("-j", "--jobs", type=int, default=None, help="并行加载和渲染的进程数，默认为 CPU 核数")
+@click.option("--precompress", is_flag=True, default=None, help="为文本文件生成 .gz/.br 压缩文件")
+@click.option("--minify/--no-minify", default=None, help="压缩生成的 HTML，默认使用配置中的 MINIFY_HTML")
+@click.option("--profile", is_flag=True, help="统计各阶段耗时，报告写入 .zogn-cache/profile.json")
+@click.option("--profile-memory", is_flag=True, help="同 --profile，并使用 tracemalloc 统计内存峰值")
 @root_command
-def build():
-    if os.path.exists(conf.HTML_OUTPUT_PATH):
+def build(no_cache, incremental, jobs, precompress, minify, profile, profile_memory):
+    from zogn import profiling
+
+    if profile or profile_memory:
+        profiling.profiler = profiling.Profiler(memory=profile_memory)
+    phase = profiling.phase
+
+    # 构建相关的模块依赖较多，只在需要时导入，保证其他命令启动迅速
+    with phase("import"):
+        from zogn import builders
+        from zogn.assets import build_assets
+        from zogn.builders import build_article, build_category, build_about, build_sitemap, build_static, \
+            build_index, build_tags, build_all_tags, build_rss, build_links, build_archives
+        from zogn.compress import remove_stale_variants
+        from zogn.depends import DependencyGraph
+        from zogn.images import build_images
+        from zogn.outputs import OutputManifest
+        from zogn.parsers import check_repeat_slug, load_all_data
+        from zogn.search import build_search
+
+    if no_cache:
+        conf.CACHE_ENABLED = False
+        builders.env.bytecode_cache = None
+    if minify is not None:
+        conf.MINIFY_HTML = minify
+    precompress = precompress or (precompress is None and conf.PRECOMPRESS)
+    if precompress:
+        from zogn.compress import available_encodings
+
+        # 页面在渲染时同时写入压缩文件，其余文件在构建结束时压缩
+        builders.stream_encodings = available_encodings()
+
+    output_manifest = OutputManifest(conf.CACHE_PATH / "outputs.json", conf.HTML_OUTPUT_PATH)
+
+    # 有上次构建的清单时保留输出目录，内容没有变化的文件不再写入，多余的页面在构建结束时删除
+    if not incremental and not output_manifest.previous and os.path.exists(conf.HTML_OUTPUT_PATH):
         CNAME_PATH = conf.HTML_OUTPUT_PATH / "CNAME"
         if not os.path.exists(CNAME_PATH):
             shutil.rmtree(conf.HTML_OUTPUT_PATH)
@@ -68,27 +101,130 @@ def build():
             with CNAME_PATH.open("w") as f:
                 f.write(CNAME)
 
-    check_repeat_slug()
+    with phase("check_repeat_slug"):
+        check_repeat_slug()
+    with phase("load_all_data"):
+        load_all_data(jobs)
 
     articles = conf.POST_DATA["articles"]
+    # 页面中引用的静态资源地址依赖资源清单，需要先于页面构建
+    with phase("build_assets"):
+        build_assets()
+
+    with phase("collect"):
+        graph = DependencyGraph(conf.CACHE_PATH / "build-graph.json", builders.env, force=not incremental)
+        graph.collect(conf.POST_DATA)
+    builders.build_graph = graph
+    builders.render_queue = builders.RenderQueue(jobs)
+    builders.output_manifest = output_manifest
+
+    steps = [
+        (build_article, (articles,)),
+        (build_sitemap, (articles,)),
+        (build_category, (articles,)),
+        (build_tags, (articles,)),
+        (build_all_tags, (articles,)),
+        (build_index, (articles,)),
+        (build_rss, (articles,)),
+        (build_archives, (articles,)),
+        (build_images, (articles, jobs)),
+        (build_static, ()),
+        (build_links, ()),
+        (build_about, ()),
+        (build_search, (articles,)),
+    ]
+    for func, args in steps:
+        # 并行渲染时页面只是入队，模板渲染和写入的耗时计入 render
+        with phase(func.__name__):
+            func(*args)
+    with phase("render"):
+        builders.render_queue.flush()
+
+    with phase("remove_stale"):
+        graph.remove_stale()
+        graph.save()
+        # 未开启预压缩时，修改过的文件的旧压缩文件也要删除
+        remove_stale_variants(conf.HTML_OUTPUT_PATH)
+
+    stats = builders.minify_stats
+    if conf.MINIFY_HTML and stats["original"]:
+        saved = stats["original"] - stats["written"]
+        click.echo(f"HTML 压缩节省 {saved / 1024:.1f} KB（{saved / stats['original']:.1%}）")
+
+    if precompress:
+        from zogn.compress import Precompressor
+
+        with phase("precompress"):
+            compressed, skipped = Precompressor(conf.CACHE_PATH / "precompress.json", jobs).run(conf.HTML_OUTPUT_PATH)
+        click.echo(f"压缩 {compressed} 个文件，跳过 {skipped} 个")
+    if incremental:
+        click.echo(f"重新生成 {graph.rebuilt} 个页面，跳过 {graph.skipped} 个")
+
+    # 部署时只需上传新增和修改的文件，并删除 deleted 中的文件
+    with phase("output_manifest"):
+        diff = output_manifest.finish(conf.CACHE_PATH / "deploy-manifest.json")
+    click.echo(f"新增 {len(diff['added'])} 个文件，修改 {len(diff['changed'])} 个，删除 {len(diff['deleted'])} 个")
+
+    if profiling.profiler is not None:
+        report = profiling.profiler.save(conf.CACHE_PATH / "profile.json")
+        click.echo(profiling.profiler.summary(report))
+        click.echo(f"性能报告已写入 {conf.CACHE_PATH / 'profile.json'}")
+
+
+@cli.group("cache", short_help="渲染缓存")
+def cache_group():
+    pass
+
+
+@cache_group.command("clear", short_help="清空缓存")
+@root_command
+def cache_clear():
+    from zogn import cache
+
+    cache.clear_all()
+
+
+@cli.group("theme", short_help="主题")
+def theme_group():
+    pass
+
 
-    build_article(articles)
-    build_sitemap(articles)
-    build_category(articles)
-    build_tags(articles)
-    build_all_tags(articles)
-    build_index(articles)
-    build_rss(articles)
-    build_archives(articles)
-    build_static()
-    build_links()
-    build_about()
+@theme_group.command("compile", short_help="预编译主题模板")
+@root_command
+def theme_compile():
+    """
+    编译主题中的所有模板并写入字节码缓存，之后的构建和预览无需再编译模板
+    """
+    from jinja2 import TemplateSyntaxError
+    from zogn.builders import env
+
+    if env.bytecode_cache is None:
+        raise click.ClickException("缓存已关闭，无法保存编译结果")
+
+    errors = []
+    # 模板目录中可能还有图片等其他文件
+    names = env.list_templates(extensions=TEMPLATE_EXTENSIONS)
+    for name in names:
+        try:
+            env.get_template(name)
+        except TemplateSyntaxError as e:
+            errors.append(f"{e.filename}:{e.lineno} {e.message}")
+        except UnicodeDecodeError as e:
+            errors.append(f"{name} 不是 UTF-8 编码：{e.reason}")
+    for error in errors:
+        click.echo(error, err=True)
+    if errors:
+        raise click.ClickException(f"{len(errors)} 个模板编译失败")
+    click.echo(f"已编译 {len(names)} 个模板到 {conf.TEMPLATE_CACHE_PATH}")
 
 
 @cli.command("new", short_help="新建文章")
 @click.argument('filename')
 @root_command
 def generate_markdown(filename):
+    from slugify import slugify
+    from zogn.builders import writer
+
     tmp_str_list = []
     title = exact_filename(filename)
     public_date = date.today()
@@ -108,6 +244,8 @@ def generate_markdown(filename):
 @cli.command("init", short_help="新建项目")
 @click.argument("name")
 def init_command(name):
+    from zogn.builders import writer
+
     project_path = conf.BASE_DIR.joinpath(name)
     project_path.mkdir(parents=True, exist_ok=True)
     project_path.joinpath(conf.CONTENT_FOLDER_NAME).mkdir(parents=True, exist_ok=True)
@@ -121,46 +259,67 @@ def init_command(name):
 @cli.command("load", short_help="加载日志")
 @click.argument("filepath")
 def init_command(filepath):
-    text = open(filepath, "r").read()
-    matches = re.findall(pattern, text, re.DOTALL)
-    for match in matches:
-        daily_meta, content = match
-        # content = content.replace('\n', '\n\n')
-        daily_metas = re.search(meta_pattern, daily_meta.strip())
-        daily_date, daily_day, daily_weather, _daily_date, _daily_day = daily_metas.groups()
-        if _daily_day is None:
-            article_date = daily_date
-            article_day = daily_day
-            article_weather = daily_weather
-        else:
-            article_date = _daily_date
-            article_day = _daily_day
-            article_weather = daily_weather
-
-        article_date = datetime.strptime(article_date, "%Y年%m月%d日")
-        daily_title = article_date.strftime("%Y%m%d")
-
-        tmp_str_list = []
-        embedded_data = {"title": daily_title, "slug": daily_title, "category": "日常", "status": "public",
-                         "date": article_date.strftime("%Y-%m-%d"), "day": article_day, "tag": [],
-                         "weather": article_weather if article_weather else ""}
-        for key, val in embedded_data.items():
-            tmp_str_list.append(f"{key}: {val}")
-        meta_str = "\n".join(tmp_str_list)
-        template = conf.DEFAULT_POST_TEMPLATE.format(meta_str).strip()
-        template += "\n" + content
-        parent_folder = conf.DAILY_PATH.joinpath(article_date.strftime("%Y"), article_date.strftime("%Y%m"))
-        parent_folder.mkdir(parents=True, exist_ok=True)
+    from zogn.journal import import_journal
 
-        filename = parent_folder.joinpath(daily_title)
-        writer(f'{filename}.md', template)
+    stats = import_journal(filepath)
+    click.echo(f"新增 {stats['added']} 篇日志，更新 {stats['updated']} 篇，{stats['unchanged']} 篇未变化")
 
 
 @cli.command("server", short_help="本地预览")
+@click.option("--no-cache", is_flag=True, help="不使用渲染缓存")
+@click.option("-j", "--jobs", type=int, default=None, help="并行加载的进程数，默认为 CPU 核数")
+@click.option("--live-reload/--no-live-reload", default=True, help="文件变化时只重新解析变化的文章并刷新浏览器")
+@click.option("--static", "static", is_flag=True, help="直接提供构建好的输出目录，与部署的内容一致")
+@click.option("--host", default="127.0.0.1", help="监听地址")
+@click.option("--port", type=int, default=9999, help="监听端口")
+@click.option("-w", "--workers", type=int, default=0,
+              help="工作进程数，大于 0 时使用多进程服务器，共享主进程加载的数据，SIGHUP 平滑重启")
+@click.option("--debug/--no-debug", default=None,
+              help="启用 Werkzeug 调试器，默认只在监听本机地址时启用，调试器可以执行任意代码")
 @root_command
-def server_command():
+def server_command(no_cache, jobs, live_reload, static, host, port, workers, debug):
+    if static:
+        from zogn.static_server import app
+
+        if not conf.HTML_OUTPUT_PATH.is_dir():
+            raise click.ClickException("输出目录不存在，请先运行 zogn build")
+        if workers:
+            from zogn.prefork import PreforkServer
+
+            PreforkServer(app, host, port, workers).serve_forever()
+        else:
+            app.run(host=host, port=port, threaded=True)
+        return
+
+    from zogn.builders import env
+    from zogn.parsers import check_repeat_slug
+    from zogn.server import app, load_site, serve_workers
+
+    if no_cache:
+        conf.CACHE_ENABLED = False
+        env.bytecode_cache = None
+
     check_repeat_slug()
-    app.run(port=9999, debug=True)
+    if workers:
+        # 文件变化时由主进程重新解析并重启工作进程，浏览器不自动刷新
+        serve_workers(host, port, workers, jobs, watch=live_reload)
+        return
+    if debug is None:
+        debug = is_loopback(host)
+    elif debug and not is_loopback(host):
+        click.echo(f"警告：调试器可以执行任意代码，{host} 上的其他机器都能访问", err=True)
+    load_site(jobs, watch=live_reload)
+    # 自动刷新由文件监视完成，不再需要 Flask 重启整个进程
+    app.run(host=host, port=port, debug=debug, use_reloader=not live_reload, threaded=True)
+
+
+def is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
 
 
 if __name__ == '__main__':
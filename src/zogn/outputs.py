@@ -0,0 +1,212 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from zogn.compress import compressor, is_fresh, remove_variants, ENCODING_SUFFIXES, MIN_SIZE
+
+MANIFEST_VERSION = 1
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def atomic_write(path, data):
+    """
+    先写入同目录下的临时文件再重命名，读取方不会看到写了一半的文件
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _discard(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class AtomicStream:
+    """
+    逐块写入临时文件并计算哈希，同时为 encodings 中的每种压缩方式写入压缩文件，不在内存中拼接完整内容
+
+    正常退出 with 块时提交：哈希与 previous_hash 相同且文件存在时丢弃临时文件，保留原文件的修改时间；
+    出错时删除所有临时文件
+    """
+
+    def __init__(self, path, previous_hash=None, encodings=(), on_commit=None):
+        self.path = str(path)
+        self.previous_hash = previous_hash
+        self.on_commit = on_commit
+        self.result = None
+        head, name = os.path.split(self.path)
+        self.tmp = os.path.join(head, f".{name}.{os.getpid()}.tmp")
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._file = open(self.tmp, "wb")
+        self._variants = []
+        self._encodings = tuple(encodings)
+        try:
+            for encoding in encodings:
+                suffix = ENCODING_SUFFIXES[encoding]
+                self._variants.append((self.path + suffix, f"{self.tmp}{suffix}", open(f"{self.tmp}{suffix}", "wb"),
+                                       *compressor(encoding)))
+        except BaseException:
+            self.abort()
+            raise
+
+    def write(self, data):
+        self._file.write(data)
+        self._digest.update(data)
+        self._size += len(data)
+        for _, _, f, process, _ in self._variants:
+            f.write(process(data))
+
+    def _close(self):
+        self._file.close()
+        for _, _, f, _, _ in self._variants:
+            f.close()
+
+    def abort(self):
+        self._close()
+        for temp in [self.tmp, *(variant[1] for variant in self._variants)]:
+            _discard(temp)
+
+    def commit(self):
+        for _, _, f, _, finish in self._variants:
+            f.write(finish())
+        self._close()
+
+        digest = self._digest.hexdigest()
+        unchanged = digest == self.previous_hash and os.path.exists(self.path)
+        if unchanged:
+            os.remove(self.tmp)
+        else:
+            os.replace(self.tmp, self.path)
+            # 本次没有写入的压缩文件已经过期
+            remove_variants(self.path, keep=self._encodings)
+        # 压缩文件在原文件之后替换，修改时间不早于原文件
+        for target, temp, _, _, _ in self._variants:
+            if self._size < MIN_SIZE:
+                _discard(temp)
+                _discard(target)
+            elif unchanged and is_fresh(self.path, target):
+                _discard(temp)
+            else:
+                os.replace(temp, target)
+        if self.on_commit is not None:
+            self.on_commit(self.path, digest)
+        self.result = (digest, self._size)
+        return self.result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+
+
+class OutputManifest:
+    """
+    记录输出目录中每个文件的内容哈希
+
+    页面内容与上次构建相同时不再写入，保留原来的修改时间；构建结束后与上次的清单比较，
+    生成新增、修改、删除的文件列表供部署使用
+    """
+
+    def __init__(self, path, root):
+        self.path = Path(path)
+        self.root = Path(root)
+        self.previous = {}
+        self.entries = {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.previous = data["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def __getstate__(self):
+        # 渲染进程只需要上次的哈希判断是否跳过写入
+        return {"path": self.path, "root": self.root, "previous": self.previous, "entries": {}}
+
+    def owns(self, path):
+        try:
+            Path(path).relative_to(self.root)
+        except ValueError:
+            return False
+        return True
+
+    def _relpath(self, path):
+        return Path(path).relative_to(self.root).as_posix()
+
+    def write(self, path, data):
+        """
+        内容变化时原子写入，返回内容哈希
+        """
+        digest = content_hash(data)
+        entry = self.previous.get(self._relpath(path))
+        if entry is None or entry["hash"] != digest or not os.path.exists(path):
+            atomic_write(path, data)
+            remove_variants(str(path))
+        self.add(path, digest)
+        return digest
+
+    def open(self, path, encodings=()):
+        """
+        逐块写入文件，与 write 相同，内容没有变化时不替换原文件，提交时记录到清单
+        """
+        entry = self.previous.get(self._relpath(path))
+        return AtomicStream(path, entry["hash"] if entry else None, encodings, on_commit=self.add)
+
+    def add(self, path, digest):
+        stat = os.stat(path)
+        self.entries[self._relpath(path)] = {"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def track(self, path):
+        """
+        记录由其他步骤生成的文件，大小和修改时间都没变时沿用上次的哈希
+        """
+        stat = os.stat(path)
+        entry = self.previous.get(self._relpath(path))
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            digest = entry["hash"]
+        else:
+            with open(path, "rb") as f:
+                digest = content_hash(f.read())
+        self.entries[self._relpath(path)] = {"hash": digest, "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+    def finish(self, deploy_path):
+        """
+        扫描输出目录，保存清单，并把与上次构建的差异写入 deploy_path
+        """
+        for root, dirs, files in os.walk(self.root):
+            for file in files:
+                path = os.path.join(root, file)
+                if self._relpath(path) not in self.entries:
+                    self.track(path)
+
+        added, changed = [], []
+        for rel, entry in sorted(self.entries.items()):
+            old = self.previous.get(rel)
+            if old is None:
+                added.append(rel)
+            elif old["hash"] != entry["hash"]:
+                changed.append(rel)
+        deleted = sorted(set(self.previous) - set(self.entries))
+        diff = {"added": added, "changed": changed, "deleted": deleted,
+                "unchanged": len(self.entries) - len(added) - len(changed)}
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps({"version": MANIFEST_VERSION, "files": self.entries}).encode("utf-8"))
+        atomic_write(deploy_path, json.dumps(diff, ensure_ascii=False, indent=2).encode("utf-8"))
+        self.previous = self.entries
+        return diff
@@ -1,133 +1,43 @@
-from xml.etree import ElementTree as etree
-
-import yaml, re, os
-import mistune
-from PIL import Image
-from urllib.parse import unquote, quote
+import functools
+import re, os, time
 from copy import deepcopy
-
-from mistune import HTMLRenderer, escape_html
+from concurrent.futures import ProcessPoolExecutor
 
 from itertools import groupby
 from operator import itemgetter
 
-from markdown import Markdown
-from markdown.inlinepatterns import LinkInlineProcessor, IMAGE_LINK_RE
-
+from zogn import __version__, conf, profiling
+from zogn.cache import render_cache
+from zogn.frontmatter import frontmatter_index, load_yaml
+from zogn.images import image_stats
+from zogn.related import insert_related
 from zogn.conf import (CONTENT_PATH, POST_PATH, POST_HTML_FOLDER_NAME, DAILY_PATH,
-                       POST_DATA, SLUG_TO_PATH, BASE_DIR)
-
-
-class ImageInlineProcessor(LinkInlineProcessor):
-    """ Return a img element from the given match. """
-
-    def handleMatch(self, m, data):
-        text, index, handled = self.getText(data, m.end(0))
-        if not handled:
-            return None, None, None
-
-        src, title, index, handled = self.getLink(data, index)
-        if not handled:
-            return None, None, None
-
-        # 让图片居中显示
-        p = etree.Element("div")
-        p.set("style", "text-align:center")
-        el = etree.SubElement(p, "img")
-
-        def sub_relative_identifier(a):
-            start = 0
-            end = 0
-            pattern = re.compile("(\.\.)+?")
-            for i in pattern.finditer(a):
-                end = i.end()
-            if start + end:
-                return a[end:]
-            return a
-
-        src = sub_relative_identifier(src)
-        el.set("src", src)
-        if title is not None:
-            el.set("title", title)
-
-        el.set("data-src", src)
-        return p, m.start(0), index
-
-
-class MyMarkdown(Markdown):
-
-    def build_parser(self):
-        super().build_parser()
-        self.inlinePatterns.register(ImageInlineProcessor(IMAGE_LINK_RE, self), 'image_link', 150)
-        return self
-
-
-class MyRenderer(HTMLRenderer):
-
-    def clean_path(self, path):
-        # 判断是否是完整的URL路径
-        is_url = path.startswith(('http:', 'https:'))
-
-        # 将路径规范化，处理多余的分隔符和相对路径
-        cleaned_path = os.path.normpath(path)
+                       POST_DATA, SLUG_TO_PATH)
 
-        # 如果是完整的URL路径，则不添加斜杠
-        if is_url:
-            return cleaned_path
+# 修改 MyRenderer 或 content2markdown 的输出时需要递增，使旧的渲染缓存失效
+RENDERER_REVISION = 3
 
-        # 切分路径为目录和文件名
-        directory, filename = os.path.split(cleaned_path)
+# 文章数量少于该值时进程池的启动开销大于收益，直接串行加载
+PARALLEL_LOAD_THRESHOLD = 64
 
-        # 处理目录部分，去除多余的 "../"
-        components = directory.split(os.sep)
-        cleaned_components = [component for component in components if component not in ('..', '')]
 
-        # 重新构建清理后的路径，保留根目录斜杠
-        cleaned_directory = os.path.join("/", *cleaned_components)
+@functools.lru_cache(maxsize=None)
+def render_version():
+    import mistune
 
-        # 最终路径
-        cleaned_path = os.path.join(cleaned_directory, filename)
+    widths = ",".join(map(str, conf.IMAGE_WIDTHS))
+    return f"zogn-{__version__}-mistune-{mistune.__version__}-r{RENDERER_REVISION}-w{widths}"
 
-        return cleaned_path
 
-    def convert_and_save_image(self, input_path, output_format="WEBP"):
-        if input_path.startswith(('http:', 'https:')):
-            return input_path
+def __getattr__(name):
+    # Markdown 渲染器依赖 mistune、Markdown 和 Pillow，只在用到时才导入
+    if name in ("ImageInlineProcessor", "MyMarkdown", "MyRenderer"):
+        from zogn import renderers
+        return getattr(renderers, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        # 构建输出路径，将文件名的扩展名更改为指定的格式
-        output_path = os.path.splitext(input_path)[0] + "." + output_format.lower()
-        save_path = BASE_DIR.as_posix().strip() + output_path.strip()
 
-        if os.path.exists(save_path):
-            return output_path
-
-        fullpath = BASE_DIR.as_posix().strip() + input_path.strip()
-        # 打开图像文件
-        img = Image.open(fullpath)
-
-        # 转换并保存图像
-        img.convert("RGB").save(save_path, format=output_format, quality=85)
-        return output_path
-
-    def paragraph(self, text):
-        if "<br>" in text:
-            return '<p>' + text + '</p><br>\n'
-        return '<p>' + text + '</p>\n'
-
-    def image(self, src, alt="", title=None):
-        src = self._safe_url(src)
-
-        unquote_src = self.clean_path(unquote(src))
-        img_src = quote(self.convert_and_save_image(unquote_src))
-
-        alt = escape_html(alt)
-        s = '<img src="' + img_src + '" alt="' + alt + '"'
-        if title:
-            s += ' title="' + escape_html(title) + '"'
-        return s + ' />'
-
-
-def content2markdown(content):
+def content2markdown(content, images=None):
     # 使用正则表达式匹配四个连续的换行符，并在替换时将其中的三个替换为 \n<br>\n
     pattern = re.compile(r'(\n{4})')
 
@@ -150,11 +60,38 @@ def content2markdown(content):
     # markdown = mistune.create_markdown(escape=False, hard_wrap=True)
     # use this renderer instance
 
-    markdown = mistune.Markdown(renderer=MyRenderer(escape=False))
+    import mistune
+    from zogn.renderers import MyRenderer
+
+    markdown = mistune.Markdown(renderer=MyRenderer(escape=False, images=images))
     content = markdown(content)
     return content
 
 
+def render_markdown(content):
+    """
+    渲染正文与摘要并返回引用的本地图片，内容未变化时直接读取缓存，跳过 mistune
+    """
+    key = render_cache.make_key(render_version(), content)
+    if conf.CACHE_ENABLED:
+        cached = render_cache.get(key)
+        # srcset 依赖图片的宽度，图片变化后重新渲染
+        if cached is not None and (not conf.IMAGE_WIDTHS or cached.get("image_stats") == image_stats(cached["images"])):
+            return cached["body"], cached["abstract"], cached["is_more"], cached["images"]
+
+    images = []
+    body = content2markdown(content, images)
+    abstract, is_more = extract_abstract(content, 200)
+    abstract = content2markdown(abstract)
+
+    if conf.CACHE_ENABLED:
+        entry = {"body": body, "abstract": abstract, "is_more": is_more, "images": images}
+        if conf.IMAGE_WIDTHS:
+            entry["image_stats"] = image_stats(images)
+        render_cache.set(key, entry)
+    return body, abstract, is_more, images
+
+
 def parse_markdown(file):
     frontmatter, content = "", ""
     firstline = file.readline().strip()
@@ -164,7 +101,7 @@ def parse_markdown(file):
         content = remained.strip()
     else:
         content = "\n\n".join([firstline, remained])
-    metadata = yaml.load(frontmatter, Loader=yaml.FullLoader) or {}
+    metadata = load_yaml(frontmatter)
     return metadata, content
 
 
@@ -181,54 +118,98 @@ def refactor_metadata_tags_and_category(metadata):
     return metadata
 
 
-def load_all_articles():
-    articles = []
+def load_markdown_file(path):
+    """
+    解析单个 Markdown 文件，草稿返回 None
+    """
+    with path.open("r", encoding="utf-8") as f:
+        metadata, content = parse_markdown(f)
+    if metadata["status"] == "draft":
+        return None
+    metadata["content"] = content
+    metadata["slug"] = str(metadata["slug"])
+    metadata["title"] = str(metadata["title"])
+    metadata["body"], metadata["abstract"], metadata["is_more"], metadata["images"] = render_markdown(content)
+    metadata["url"] = f'/{POST_HTML_FOLDER_NAME}/{metadata["slug"]}' if POST_HTML_FOLDER_NAME else f'/{metadata["slug"]}'
+    return refactor_metadata_tags_and_category(metadata)
 
-    for p in POST_PATH.rglob("**/*.md"):
-        with p.open("r", encoding="utf-8") as f:
-            metadata, content = parse_markdown(f)
-            if metadata["status"] == "draft":
-                continue
-            metadata["content"] = content
-            metadata["slug"] = str(metadata["slug"])
-            metadata["title"] = str(metadata["title"])
-            metadata["body"] = content2markdown(content)
-            abstract, is_more = extract_abstract(content, 200)
-            metadata["abstract"] = content2markdown(abstract)
-            metadata["is_more"] = is_more
-            metadata["url"] = f'/{POST_HTML_FOLDER_NAME}/{metadata["slug"]}' if POST_HTML_FOLDER_NAME else f'/{metadata["slug"]}'
-            metadata = refactor_metadata_tags_and_category(metadata)
-            articles.append(metadata)
-
-            SLUG_TO_PATH[f"{metadata['slug']}"] = p.as_posix()
+
+def load_markdown_folders(folders, jobs=None):
+    """
+    解析多个目录下的所有 Markdown 文件，返回 {目录: [(路径, 元数据), ...]}，文件较多时使用进程池并行解析和渲染
+
+    所有目录的文件合并后交给同一个进程池；每个目录的结果按文件遍历顺序排列，与串行加载完全一致；
+    草稿只读取元数据，结果为 None
+    """
+    scanned = {folder: frontmatter_index.scan(folder) for folder in folders}
+    paths = [p for items in scanned.values() for p, metadata in items if metadata.get("status") != "draft"]
+    jobs = jobs or os.cpu_count() or 1
+
+    load = load_markdown_file if profiling.profiler is None else _load_markdown_file_timed
+    if jobs > 1 and len(paths) >= PARALLEL_LOAD_THRESHOLD:
+        chunksize = max(1, len(paths) // (jobs * 4))
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_load_worker,
+                                 initargs=(conf.CACHE_ENABLED, conf.IMAGE_WIDTHS)) as executor:
+            results = list(executor.map(load, paths, chunksize=chunksize))
+    else:
+        results = list(map(load, paths))
+
+    if profiling.profiler is not None:
+        for p, (metadata, wall) in zip(paths, results):
+            profiling.profiler.record_post(p.as_posix() if metadata is None else metadata["slug"], wall)
+        results = [metadata for metadata, _ in results]
+
+    loaded = dict(zip(paths, results))
+    return {folder: [(p, loaded.get(p)) for p, _ in items] for folder, items in scanned.items()}
+
+
+def load_markdown_files(folder, jobs=None):
+    """
+    解析目录下的所有 Markdown 文件，返回 (路径, 元数据) 列表
+    """
+    return load_markdown_folders([folder], jobs)[folder]
+
+
+def _init_load_worker(cache_enabled, image_widths):
+    # spawn/forkserver 启动的工作进程重新导入 conf，命令行参数（如 --no-cache）需要显式传入
+    conf.CACHE_ENABLED = cache_enabled
+    conf.IMAGE_WIDTHS = image_widths
+
+
+def _load_markdown_file_timed(path):
+    start = time.perf_counter()
+    metadata = load_markdown_file(path)
+    return metadata, time.perf_counter() - start
+
+
+def _collect(items):
+    """
+    从 (路径, 元数据) 列表中取出文章，按日期倒序排列
+    """
+    articles = []
+    for p, metadata in items:
+        if metadata is None:
+            continue
+        articles.append(metadata)
+        SLUG_TO_PATH[f"{metadata['slug']}"] = p.as_posix()
 
     articles.sort(key=lambda x: x["date"], reverse=True)
     return articles
 
 
-def load_all_daily():
-    dailies = []
+def load_folder(folder, jobs=None):
+    """
+    加载目录下的所有文章，按日期倒序排列
+    """
+    return _collect(load_markdown_files(folder, jobs))
+
 
-    for p in DAILY_PATH.rglob("**/*.md"):
-        with p.open("r", encoding="utf-8") as f:
-            metadata, content = parse_markdown(f)
-            if metadata["status"] == "draft":
-                continue
-            metadata["content"] = content
-            metadata["slug"] = str(metadata["slug"])
-            metadata["title"] = str(metadata["title"])
-            metadata["body"] = content2markdown(content)
-            abstract, is_more = extract_abstract(content, 200)
-            metadata["abstract"] = content2markdown(abstract)
-            metadata["is_more"] = is_more
-            metadata["url"] = f'/{POST_HTML_FOLDER_NAME}/{metadata["slug"]}' if POST_HTML_FOLDER_NAME else f'/{metadata["slug"]}'
-            metadata = refactor_metadata_tags_and_category(metadata)
-            dailies.append(metadata)
+def load_all_articles(jobs=None):
+    return load_folder(POST_PATH, jobs)
 
-            SLUG_TO_PATH[f"{metadata['slug']}"] = p.as_posix()
 
-    dailies.sort(key=lambda x: x["date"], reverse=True)
-    return dailies
+def load_all_daily(jobs=None):
+    return load_folder(DAILY_PATH, jobs)
 
 
 def extract_abstract(content, length):
@@ -250,14 +231,13 @@ def extract_abstract(content, length):
 
 
 def check_repeat_slug():
+    # 只需要元数据，使用索引避免读取和解析正文
     TMP_SLUGS = {}
-    for p in POST_PATH.rglob("**/*.md"):
-        with p.open("r", encoding="utf-8") as f:
-            metadata, content = parse_markdown(f)
-            if metadata['slug'] in TMP_SLUGS:
-                raise RuntimeError(f"存在重复的slug；{metadata['slug']}")
+    for p, metadata in frontmatter_index.scan(POST_PATH):
+        if f"{metadata['slug']}" in TMP_SLUGS:
+            raise RuntimeError(f"存在重复的slug；{metadata['slug']}")
 
-            TMP_SLUGS[f"{metadata['slug']}"] = p.as_posix()
+        TMP_SLUGS[f"{metadata['slug']}"] = p.as_posix()
 
 
 def parse_index():
@@ -277,9 +257,13 @@ def parse_sitemap():
     return articles
 
 
+def _archive_month(article):
+    return article['date'].strftime('%Y年%m月')
+
+
 def parse_archive(articles):
     grouped_data = {}
-    for month, group in groupby(articles, key=lambda x: x['date'].strftime('%Y年%m月')):
+    for month, group in groupby(articles, key=_archive_month):
         grouped_data[month] = list(group)
     return grouped_data
 
@@ -308,54 +292,172 @@ def parse_about():
     return body
 
 
-def find_previous_and_next(current, articles):
-    articles = sorted(articles, key=itemgetter('date'), reverse=True)
-    index = articles.index(current)
+class SiteIndex:
+    """
+    站点数据的索引，由 load_all_data 建立一次，供服务器和构建函数查询
+
+    articles 须已按日期倒序排列
+    """
+
+    def __init__(self, articles):
+        self.articles = articles
+        self.by_slug = {}
+        for article in articles:
+            self.by_slug.setdefault(str(article["slug"]), article)
+
+        self.categories = parse_category(articles)
+        self.tags = parse_tag(articles)
+        self.archives = parse_archive(articles)
+
+        # 去重后的标签和分类，保持首次出现的顺序
+        self.tag_list = self._first_seen(articles, lambda article: article["tags"])
+        self.category_list = self._first_seen(articles, lambda article: [article["category"]])
+
+    @staticmethod
+    def _first_seen(articles, getter):
+        seen = {}
+        for article in articles:
+            for item in getter(article):
+                seen.setdefault(item["name"], item)
+        return list(seen.values())
+
+    def get(self, slug):
+        return self.by_slug.get(str(slug))
+
+    def patch(self, articles, removed, added):
+        """
+        返回更新后的索引，只重新排列 removed 和 added 中的文章所在的分类、标签和月份，本索引不变
+
+        articles 为更新后的全部文章，已按日期倒序排列；removed 为不再出现的文章，added 为新出现的文章，
+        结果与 SiteIndex(articles) 完全一致
+        """
+        position = {id(article): i for i, article in enumerate(articles)}
+        removed_ids = {id(article) for article in removed}
+
+        index = SiteIndex.__new__(SiteIndex)
+        index.articles = articles
+        index.by_slug = {}
+        for article in articles:
+            index.by_slug.setdefault(str(article["slug"]), article)
+        index.categories = _patch_groups(self.categories, lambda article: [article["category"]["name"]],
+                                         position, removed_ids, removed, added)
+        index.tags = _patch_groups(self.tags, lambda article: [tag["name"] for tag in article["tags"]],
+                                   position, removed_ids, removed, added)
+        index.archives = _patch_groups(self.archives, lambda article: [_archive_month(article)],
+                                       position, removed_ids, removed, added)
+        index.tag_list = [next(tag for tag in group[0]["tags"] if tag["name"] == name)
+                          for name, group in index.tags.items()]
+        index.category_list = [group[0]["category"] for group in index.categories.values()]
+        return index
+
+    def neighbours(self, position):
+        """
+        返回 (上一篇, 下一篇)，上一篇为日期更早的文章
+        """
+        articles = self.articles
+        prev_article = articles[position + 1] if position < len(articles) - 1 else None
+        next_article = articles[position - 1] if position > 0 else None
+        return prev_article, next_article
+
+
+def _patch_groups(groups, names, position, removed_ids, removed, added):
+    """
+    更新 {名称: 文章列表} 中受影响的分组，各组和组内文章的顺序与重新分组一致
+    """
+    groups = dict(groups)
+    for name in {name for article in (*removed, *added) for name in names(article)}:
+        group = [article for article in groups.get(name, ()) if id(article) not in removed_ids]
+        # 同一篇文章中重复的标签与 parse_tag 一样出现多次
+        group.extend(article for article in added for other in names(article) if other == name)
+        group.sort(key=lambda article: position[id(article)])
+        if group:
+            groups[name] = group
+        else:
+            groups.pop(name, None)
+    # 分组按首次出现的位置排列，同一篇文章中的多个标签按标签顺序
+    order = sorted(groups, key=lambda name: (position[id(groups[name][0])], names(groups[name][0]).index(name)))
+    return {name: groups[name] for name in order}
+
+
+def neighbour_fields(articles, position):
+    """
+    按日期倒序排列的 articles 中第 position 篇文章的上一篇/下一篇字段，没有时不包含该字段
+    """
+    prev_article = articles[position + 1] if position < len(articles) - 1 else None
+    next_article = articles[position - 1] if position > 0 else None
+    fields = {}
+    if next_article is not None:
+        fields["next_article"] = {"slug": next_article["slug"], "title": next_article["title"]}
+    if prev_article is not None:
+        fields["prev_article"] = {"slug": prev_article["slug"], "title": prev_article["title"]}
+    return fields
+
+
+def insert_prev_and_next(articles, index=None):
+    index = index or SiteIndex(articles)
+    for i, article in enumerate(articles):
+        article.update(neighbour_fields(index.articles, i))
+    return articles
 
-    # 根据日期获取下一篇文章
-    next_article = articles[index - 1] if index > 0 else None
 
-    # 根据日期获取上一篇文章
-    previous_article = articles[index + 1] if index < len(articles) - 1 else None
+def get_site_index(articles):
+    """
+    优先复用 load_all_data 建立的索引
+    """
+    index = conf.SITE_INDEX
+    if index is None or index.articles is not articles:
+        index = SiteIndex(articles)
+    return index
 
-    return previous_article, next_article
 
+def load_all_data(jobs=None):
+    # 文章和日常合并解析，只启动一次进程池
+    loaded = load_markdown_folders((POST_PATH, DAILY_PATH), jobs)
+    articles = _collect(loaded[POST_PATH])
 
-def insert_prev_and_next(articles):
-    for i, article in enumerate(articles):
-        prev_article, next_article = find_previous_and_next(article, articles)
-        if i == 0:
-            article["prev_article"] = {"slug": prev_article["slug"], "title": prev_article["title"]}
-        elif i == len(articles) - 1:
-            article["next_article"] = {"slug": next_article["slug"], "title": next_article["title"]}
-        else:
-            article["next_article"] = {"slug": next_article["slug"], "title": next_article["title"]}
-            article["prev_article"] = {"slug": prev_article["slug"], "title": prev_article["title"]}
-    return articles
+    dailies = _collect(loaded[DAILY_PATH])
+    articles.extend(dailies)
 
+    if conf.CACHE_ENABLED:
+        render_cache.prune()
 
-def load_all_data():
-    articles = load_all_articles()
+    result, index = build_site_data(articles)
+
+    POST_DATA.update(**result)
+    conf.SITE_INDEX = index
+    return result
 
-    dailies = load_all_daily()
-    articles.extend(dailies)
 
+def build_site_data(articles):
+    """
+    由已解析的文章生成模板使用的站点数据和索引，会在文章上写入上一篇/下一篇和相关文章
+    """
     articles = sorted(articles, key=itemgetter('date'), reverse=True)
 
-    articles = insert_prev_and_next(articles)
+    index = SiteIndex(articles)
+    insert_prev_and_next(articles, index)
+    insert_related(articles)
+    return site_data(index), index
+
+
+def site_data(index):
+    """
+    模板使用的站点数据，分组直接取自索引
+    """
+    articles = index.articles
 
     # 分类
-    categories = parse_category(articles)
+    categories = index.categories
     categories_count = sorted([{"name": category, "count": len(_)} for category, _ in categories.items()],
                               key=lambda x: x["count"], reverse=True)
 
     # 标签
-    tags = parse_tag(articles)
+    tags = index.tags
     tags_count = sorted([{"name": tag, "count": len(_)} for tag, _ in tags.items()],
                         key=lambda x: x["count"], reverse=True)
 
     # 归档
-    archives = parse_archive(articles)
+    archives = index.archives
     archives_count = sorted([{"name": year, "count": len(_)} for year, _ in archives.items()],
                             key=lambda x: x["name"], reverse=True)
 
@@ -366,6 +468,4 @@ def load_all_data():
         },
         "recently": articles[:6]
     }
-
-    POST_DATA.update(**result)
     return result
@@ -0,0 +1,153 @@
+import gc
+import os
+import signal
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+# 旧的工作进程最多等待这么久，长连接（如 /__livereload）不会一直阻止退出
+GRACEFUL_TIMEOUT = 30
+
+
+class PreforkServer:
+    """
+    多进程 HTTP 服务器：主进程准备好数据后 fork 出多个工作进程，工作进程共同监听同一个套接字，
+    通过写时复制共享主进程中的数据，不需要各自重新加载
+
+    poll 返回 True 或收到 SIGHUP（调用 reload）时平滑重启：先启动新的工作进程，
+    再让旧的工作进程处理完正在进行的请求后退出
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=9999, workers=2, threads=True,
+                 poll=None, reload=None, interval=0.5):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.poll = poll
+        self.reload = reload
+        self.interval = interval
+        self.generation = 0
+        # 工作进程 pid -> 所属的代数
+        self.children = {}
+        self.socket = None
+        self._reload_requested = False
+        self._stopping = False
+
+    def _listen(self):
+        family = socket.AF_INET6 if ":" in self.host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(128)
+        sock.set_inheritable(True)
+        return sock
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                self._serve()
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = self.generation
+
+    def _serve(self):
+        """
+        工作进程：收到 SIGTERM 后停止接受新连接，等待正在处理的请求结束
+        """
+        server = make_server(self.host, self.port, self.app, threaded=self.threads, fd=self.socket.fileno())
+        server.daemon_threads = False
+
+        def stop(signum, frame):
+            threading.Thread(target=server.shutdown, daemon=True).start()
+            timer = threading.Timer(GRACEFUL_TIMEOUT, os._exit, args=(0,))
+            timer.daemon = True
+            timer.start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+
+    def _start_generation(self):
+        old = [pid for pid, generation in self.children.items() if generation == self.generation]
+        self.generation += 1
+        # 冻结已有对象，避免垃圾回收修改对象头导致共享的内存页被复制
+        if hasattr(gc, "freeze"):
+            gc.freeze()
+        for _ in range(self.workers):
+            self._spawn()
+        for pid in old:
+            self._kill(pid, signal.SIGTERM)
+
+    def _kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            self.children.pop(pid, None)
+
+    def _reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.children.pop(pid, None)
+            # 当前一代的工作进程意外退出时补上
+            if generation == self.generation and not self._stopping:
+                print(f"工作进程 {pid} 已退出，重新启动")
+                self._spawn()
+
+    def _request_reload(self, signum, frame):
+        self._reload_requested = True
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def serve_forever(self):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("多进程模式需要支持 fork 的系统")
+        self.socket = self._listen()
+        signal.signal(signal.SIGHUP, self._request_reload)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        print(f" * 运行于 http://{self.host}:{self.port}/，{self.workers} 个工作进程，主进程 {os.getpid()}")
+
+        self._start_generation()
+        try:
+            while not self._stopping:
+                time.sleep(self.interval)
+                self._reap()
+                if self._stopping:
+                    break
+                if self._reload_requested:
+                    self._reload_requested = False
+                    if self.reload is not None:
+                        self.reload()
+                    self._start_generation()
+                elif self.poll is not None and self.poll():
+                    self._start_generation()
+        finally:
+            for pid in list(self.children):
+                self._kill(pid, signal.SIGTERM)
+            for pid in list(self.children):
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+            self.children.clear()
+            self.socket.close()
@@ -0,0 +1,133 @@
+import contextlib
+import json
+import os
+import platform
+import time
+from datetime import datetime
+
+REPORT_VERSION = 1
+
+# 由 build --profile 设置为 Profiler，为 None 时各处的计时代码直接跳过
+profiler = None
+
+_NULL = contextlib.nullcontext()
+
+
+class Profiler:
+    """
+    记录构建各阶段、各模板、文件写入的耗时和次数，以及加载最慢的文章
+
+    开启 memory 时使用 tracemalloc 记录每个阶段的内存峰值（只统计主进程）
+    """
+
+    def __init__(self, memory=False, top=10):
+        self.memory = memory
+        self.top = top
+        self.phases = {}
+        self.groups = {}
+        self.posts = []
+        self.started = time.perf_counter()
+        if memory:
+            import tracemalloc
+            tracemalloc.start()
+
+    @staticmethod
+    def _add(table, name, wall, cpu, count=1):
+        item = table.setdefault(name, {"wall": 0.0, "cpu": 0.0, "count": 0})
+        item["wall"] += wall
+        item["cpu"] += cpu
+        item["count"] += count
+        return item
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        if self.memory:
+            import tracemalloc
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            item = self._add(self.phases, name, time.perf_counter() - wall, time.process_time() - cpu)
+            if self.memory:
+                import tracemalloc
+                item["peak_memory"] = max(item.get("peak_memory", 0), tracemalloc.get_traced_memory()[1])
+
+    def record(self, group, name, wall, cpu=0.0):
+        """
+        累加一次计时，group 为 template、write 等分类
+        """
+        self._add(self.groups.setdefault(group, {}), name, wall, cpu)
+
+    def record_post(self, slug, wall):
+        self.posts.append((wall, slug))
+
+    def drain(self):
+        """
+        取出并清空已记录的数据，用于从子进程返回给主进程
+        """
+        data = {"groups": self.groups, "posts": self.posts}
+        self.groups, self.posts = {}, []
+        return data
+
+    def merge(self, data):
+        for group, items in data["groups"].items():
+            for name, item in items.items():
+                self._add(self.groups.setdefault(group, {}), name, item["wall"], item["cpu"], item["count"])
+        self.posts.extend(data["posts"])
+
+    def report(self):
+        posts = sorted(self.posts, reverse=True)[:self.top]
+        report = {
+            "version": REPORT_VERSION,
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpu_count": os.cpu_count(),
+            "total": time.perf_counter() - self.started,
+            "phases": self.phases,
+            "groups": self.groups,
+            "slowest_posts": [{"slug": slug, "wall": wall} for wall, slug in posts],
+        }
+        if self.memory:
+            import tracemalloc
+            report["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        return report
+
+    def summary(self, report=None):
+        report = report or self.report()
+        lines = [f"{'阶段':<32}{'次数':>8}{'墙钟(s)':>12}{'CPU(s)':>12}{'内存峰值(MB)':>16}"]
+
+        def row(name, item):
+            peak = item.get("peak_memory")
+            peak = f"{peak / 1024 / 1024:.1f}" if peak is not None else "-"
+            lines.append(f"{name:<32}{item['count']:>8}{item['wall']:>12.3f}{item['cpu']:>12.3f}{peak:>16}")
+
+        for name, item in report["phases"].items():
+            row(name, item)
+        for group, items in report["groups"].items():
+            lines.append("")
+            for name, item in sorted(items.items(), key=lambda x: x[1]["wall"], reverse=True):
+                row(f"{group}:{name}", item)
+        if report["slowest_posts"]:
+            lines.append("")
+            lines.append("加载最慢的文章：")
+            for post in report["slowest_posts"]:
+                lines.append(f"  {post['wall'] * 1000:>8.1f}ms  {post['slug']}")
+        lines.append("")
+        lines.append(f"总耗时 {report['total']:.3f}s")
+        return "\n".join(lines)
+
+    def save(self, path, report=None):
+        report = report or self.report()
+        from zogn.outputs import atomic_write
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(path, json.dumps(report, ensure_ascii=False, indent=2).encode("utf-8"))
+        return report
+
+
+def phase(name):
+    if profiler is None:
+        return _NULL
+    return profiler.phase(name)
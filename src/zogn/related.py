@@ -0,0 +1,280 @@
+import hashlib
+import math
+import os
+import pickle
+from collections import Counter
+
+from zogn import conf
+from zogn.depends import fingerprint
+from zogn.outputs import atomic_write
+from zogn.text import split_terms, plain_text
+
+# 修改相似度的计算方式时需要递增，使旧的缓存失效
+RELATED_REVISION = 2
+
+# 正文 TF-IDF 相似度所占的权重，其余为分类和标签的相似度
+TEXT_WEIGHT = 0.7
+# 每篇文章只保留权重最高的词
+MAX_TERMS = 32
+# 缓存中每篇文章保存的词数，按出现次数取前若干个，再从中按 TF-IDF 选出 MAX_TERMS 个
+MAX_DOC_TERMS = 64
+# 出现在超过该比例文章中的词区分度太低，不参与计算
+MAX_DF_RATIO = 0.3
+# 每次计算相似度的行数，决定临时矩阵的大小
+BLOCK_SIZE = 256
+# 需要重新计算的文章超过该比例时直接全部重新计算
+FULL_RECOMPUTE_RATIO = 0.2
+
+
+def _features(article):
+    text = Counter(split_terms(f"{article['title']} {plain_text(article.get('body'))}"))
+    terms = dict(text.most_common(MAX_DOC_TERMS)) if len(text) > MAX_DOC_TERMS else dict(text)
+    labels = [f"category:{article['category']['name']}", *(f"tag:{tag['name']}" for tag in article["tags"])]
+    return terms, labels
+
+
+def _article_key(article):
+    return fingerprint({k: article.get(k) for k in ("title", "category", "tags", "content")})
+
+
+def _normalize(matrix):
+    import numpy as np
+    from scipy import sparse
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags((1 / norms).astype(np.float32)) @ matrix
+
+
+def _flatten(groups):
+    """
+    把每篇文章的 {项: 计数} 展开为行号、列号、计数三个数组，另返回各列对应的项
+
+    列按项排序，同一篇文章的各项顺序与其他文章无关，相似度的累加顺序固定，结果逐位一致
+    """
+    import numpy as np
+
+    names = sorted({item for group in groups for item in group})
+    vocab = {item: i for i, item in enumerate(names)}
+    rows, cols, counts = [], [], []
+    for row, group in enumerate(groups):
+        rows.extend([row] * len(group))
+        cols.extend(vocab[item] for item in group)
+        counts.extend(group.values())
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(counts, dtype=np.float32), names
+
+
+def build_matrix(features):
+    """
+    每篇文章一行的稀疏矩阵，行向量已归一化，两行的点积即为两篇文章的相似度；另返回各列对应的词或标签
+    """
+    import numpy as np
+    from scipy import sparse
+
+    n = len(features)
+    rows, cols, counts, text_names = _flatten([terms for terms, _ in features])
+    size = len(text_names)
+    df = np.bincount(cols, minlength=size)
+    # 只在一篇文章中出现的词不会带来相似度，出现过多的词没有区分度
+    max_df = max(2, int(n * MAX_DF_RATIO))
+    keep = (df[cols] > 1) & (df[cols] <= max_df)
+    rows, cols, weights = rows[keep], cols[keep], counts[keep] * np.log(n / df[cols[keep]]).astype(np.float32)
+    # 每行按权重降序排列后只保留前 MAX_TERMS 个
+    order = np.lexsort((-weights, rows))
+    rows, cols, weights = rows[order], cols[order], weights[order]
+    starts = np.searchsorted(rows, rows)
+    keep = np.arange(len(rows)) - starts < MAX_TERMS
+    text_matrix = sparse.csr_matrix((weights[keep], (rows[keep], cols[keep])), shape=(n, size))
+
+    rows, cols, counts, label_names = _flatten([dict.fromkeys(labels, 1) for _, labels in features])
+    label_matrix = sparse.csr_matrix((counts, (rows, cols)), shape=(n, len(label_names)))
+
+    matrix = sparse.hstack([
+        _normalize(text_matrix) * np.float32(math.sqrt(TEXT_WEIGHT)),
+        _normalize(label_matrix) * np.float32(math.sqrt(1 - TEXT_WEIGHT)),
+    ]).tocsr()
+    matrix.sort_indices()
+    return matrix, text_names + label_names
+
+
+def row_signatures(matrix, names):
+    """
+    每行向量的摘要，由词和权重计算，与列号无关；摘要不变的文章与其他文章的相似度也不变
+    """
+    signatures = []
+    for row in range(matrix.shape[0]):
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        digest = hashlib.sha1("\0".join(names[col] for col in matrix.indices[start:end]).encode("utf-8"))
+        digest.update(matrix.data[start:end].tobytes())
+        signatures.append(digest.hexdigest())
+    return signatures
+
+
+def similar_blocks(matrix, rows):
+    """
+    分块计算 rows 中的文章与所有文章的相似度，依次返回 (行号列表, 相似度矩阵)，文章与自身的相似度记为 0
+    """
+    import numpy as np
+
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(rows), BLOCK_SIZE):
+        block = rows[start:start + BLOCK_SIZE]
+        scores = (matrix[block] @ transposed).toarray()
+        scores[np.arange(len(block)), block] = 0
+        yield block, scores
+
+
+def top_k(scores, k, ranks):
+    """
+    每行相似度最高的 k 个列号及相似度，相似度相同时 ranks 小的在前，不包括相似度为 0 的
+    """
+    import numpy as np
+
+    k = min(k, scores.shape[1])
+    # 先取每行第 k 大的值，再取出不小于它的全部列，相同的值都参与排序，结果不受 argpartition 的选择影响
+    kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+    rows, cols = np.nonzero((scores >= kth[:, None]) & (scores > 0))
+    values = scores[rows, cols]
+    order = np.lexsort((ranks[cols], -values, rows))
+    rows, cols, values = rows[order], cols[order], values[order]
+    keep = np.arange(len(rows)) - np.searchsorted(rows, rows) < k
+
+    result = [[] for _ in range(len(scores))]
+    for row, col, value in zip(rows[keep].tolist(), cols[keep].tolist(), values[keep].tolist()):
+        result[row].append((col, value))
+    return result
+
+
+class RelatedCache:
+    """
+    每篇文章的指纹、词频和相关文章列表，文章内容没变时沿用，不必重新分词
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.entries = {}
+        if not conf.CACHE_ENABLED:
+            return
+        try:
+            with open(path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("params") == params:
+                self.entries = data["entries"]
+        except Exception:
+            pass
+
+    def save(self):
+        if not conf.CACHE_ENABLED:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, pickle.dumps({"params": self.params, "entries": self.entries},
+                                             protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def compute_related(articles, k, cache):
+    """
+    返回 {slug: [(相关文章 slug, 相似度), ...]}，相似度相同时按 slug 排序，与不使用缓存的结果完全一致
+
+    内容变化会改变词的 IDF，因此按行向量的摘要判断哪些文章的向量变了，只重新计算这些文章，
+    以及原来的相关文章中有向量变化或已删除文章的那些文章；
+    向量变化的文章与其他文章的相似度同时用于更新其他文章的列表
+    """
+    import numpy as np
+
+    slugs = [article["slug"] for article in articles]
+    keys = [_article_key(article) for article in articles]
+    old = cache.entries
+
+    changed = [i for i, slug in enumerate(slugs) if slug not in old or old[slug]["key"] != keys[i]]
+    removed = set(old) - set(slugs)
+    if not changed and not removed:
+        return {slug: old[slug]["related"] for slug in slugs}
+
+    features = []
+    for i, article in enumerate(articles):
+        entry = old.get(slugs[i])
+        features.append(entry["features"] if entry is not None and entry["key"] == keys[i] else _features(article))
+    result = {slug: old[slug]["related"] for slug in slugs if slug in old}
+
+    matrix, names = build_matrix(features)
+    signatures = row_signatures(matrix, names)
+    affected = [i for i, slug in enumerate(slugs) if slug not in old or old[slug]["signature"] != signatures[i]]
+    affected_slugs = {slugs[i] for i in affected} | removed
+    stale = {i for i, slug in enumerate(slugs)
+             if slug in old and any(other in affected_slugs for other, _ in old[slug]["related"])}
+    recompute = sorted(set(affected) | stale)
+    full = len(recompute) > len(slugs) * FULL_RECOMPUTE_RATIO
+    if full:
+        recompute = list(range(len(slugs)))
+    recompute_set, affected_set = set(recompute), set(affected)
+
+    # 相似度相同时的顺序
+    position = {slug: i for i, slug in enumerate(slugs)}
+    ranks = np.empty(len(slugs), dtype=np.int64)
+    ranks[sorted(range(len(slugs)), key=slugs.__getitem__)] = np.arange(len(slugs))
+    # 沿用的列表中最后一篇的相似度和顺序，列表未满时为 (0, -1)，向量变化的文章排在它前面时才需要插入
+    threshold = np.full(len(slugs), np.inf, dtype=np.float32)
+    threshold_rank = np.full(len(slugs), -1, dtype=np.int64)
+    if not full:
+        for j, slug in enumerate(slugs):
+            if j not in recompute_set:
+                related = result[slug]
+                if len(related) >= k:
+                    threshold[j], threshold_rank[j] = related[-1][1], ranks[position[related[-1][0]]]
+                else:
+                    threshold[j] = 0
+
+    for block, scores in similar_blocks(matrix, recompute):
+        for row, related in zip(block, top_k(scores, k, ranks)):
+            result[slugs[row]] = [(slugs[j], score) for j, score in related]
+        if full:
+            continue
+        for row, row_scores in zip(block, scores):
+            if row not in affected_set:
+                continue
+            inserted = (row_scores > threshold) | ((row_scores == threshold) & (ranks[row] < threshold_rank))
+            for j in np.nonzero(inserted)[0]:
+                related = result[slugs[j]] + [(slugs[row], float(row_scores[j]))]
+                related.sort(key=lambda item: (-item[1], ranks[position[item[0]]]))
+                related = result[slugs[j]] = related[:k]
+                if len(related) >= k:
+                    threshold[j], threshold_rank[j] = related[-1][1], ranks[position[related[-1][0]]]
+
+    cache.entries = {slug: {"key": key, "features": feature, "signature": signature, "related": result[slug]}
+                     for slug, key, feature, signature in zip(slugs, keys, features, signatures)}
+    cache.save()
+    return result
+
+
+def related_lists(articles):
+    """
+    返回 {slug: [{"slug", "title", "url"}, ...]}，未开启或缺少依赖时返回 None
+    """
+    k = conf.RELATED_POSTS
+    if not k or not articles:
+        return None
+    try:
+        import numpy  # noqa: F401
+        import scipy.sparse  # noqa: F401
+    except ImportError:
+        print("计算相关文章需要安装 numpy 和 scipy：pip install numpy scipy")
+        return None
+
+    cache = RelatedCache(str(conf.CACHE_PATH / "related.pickle"), {"k": k, "revision": RELATED_REVISION})
+    related = compute_related(articles, k, cache)
+    by_slug = {article["slug"]: article for article in articles}
+    return {slug: [{"slug": other, "title": by_slug[other]["title"], "url": by_slug[other]["url"]}
+                   for other, _ in items]
+            for slug, items in related.items()}
+
+
+def insert_related(articles):
+    """
+    计算每篇文章的相关文章，写入 article["related"]，供 post/detail.html 使用
+    """
+    related = related_lists(articles)
+    if related is not None:
+        for article in articles:
+            article["related"] = related[article["slug"]]
+    return articles
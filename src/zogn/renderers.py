@@ -0,0 +1,113 @@
+from xml.etree import ElementTree as etree
+
+import re, os
+from urllib.parse import unquote, quote
+
+from markdown import Markdown
+from markdown.inlinepatterns import LinkInlineProcessor, IMAGE_LINK_RE
+from mistune import HTMLRenderer, escape_html
+
+from zogn.conf import IMAGE_WIDTHS
+from zogn.images import image_output_path, is_remote, srcset
+
+
+class ImageInlineProcessor(LinkInlineProcessor):
+    """ Return a img element from the given match. """
+
+    def handleMatch(self, m, data):
+        text, index, handled = self.getText(data, m.end(0))
+        if not handled:
+            return None, None, None
+
+        src, title, index, handled = self.getLink(data, index)
+        if not handled:
+            return None, None, None
+
+        # 让图片居中显示
+        p = etree.Element("div")
+        p.set("style", "text-align:center")
+        el = etree.SubElement(p, "img")
+
+        def sub_relative_identifier(a):
+            start = 0
+            end = 0
+            pattern = re.compile("(\.\.)+?")
+            for i in pattern.finditer(a):
+                end = i.end()
+            if start + end:
+                return a[end:]
+            return a
+
+        src = sub_relative_identifier(src)
+        el.set("src", src)
+        if title is not None:
+            el.set("title", title)
+
+        el.set("data-src", src)
+        return p, m.start(0), index
+
+
+class MyMarkdown(Markdown):
+
+    def build_parser(self):
+        super().build_parser()
+        self.inlinePatterns.register(ImageInlineProcessor(IMAGE_LINK_RE, self), 'image_link', 150)
+        return self
+
+
+class MyRenderer(HTMLRenderer):
+
+    def __init__(self, escape=True, allow_harmful_protocols=None, images=None):
+        super().__init__(escape, allow_harmful_protocols)
+        # 收集引用的本地图片，由图片转换阶段统一处理，渲染时不再编码图片
+        self.images = images
+
+    def clean_path(self, path):
+        # 判断是否是完整的URL路径
+        is_url = path.startswith(('http:', 'https:'))
+
+        # 将路径规范化，处理多余的分隔符和相对路径
+        cleaned_path = os.path.normpath(path)
+
+        # 如果是完整的URL路径，则不添加斜杠
+        if is_url:
+            return cleaned_path
+
+        # 切分路径为目录和文件名
+        directory, filename = os.path.split(cleaned_path)
+
+        # 处理目录部分，去除多余的 "../"
+        components = directory.split(os.sep)
+        cleaned_components = [component for component in components if component not in ('..', '')]
+
+        # 重新构建清理后的路径，保留根目录斜杠
+        cleaned_directory = os.path.join("/", *cleaned_components)
+
+        # 最终路径
+        cleaned_path = os.path.join(cleaned_directory, filename)
+
+        return cleaned_path
+
+    def paragraph(self, text):
+        if "<br>" in text:
+            return '<p>' + text + '</p><br>\n'
+        return '<p>' + text + '</p>\n'
+
+    def image(self, src, alt="", title=None):
+        src = self._safe_url(src)
+
+        unquote_src = self.clean_path(unquote(src))
+        img_src = quote(image_output_path(unquote_src))
+        if self.images is not None and not is_remote(unquote_src):
+            self.images.append(unquote_src)
+
+        alt = escape_html(alt)
+        s = '<img src="' + img_src + '" alt="' + alt + '"'
+        if IMAGE_WIDTHS and not is_remote(unquote_src):
+            candidates = srcset(unquote_src, IMAGE_WIDTHS)
+            # 只有原图时不需要 srcset
+            if len(candidates) > 1:
+                s += ' srcset="' + ", ".join(f"{quote(path)} {width}w" for path, width in candidates) + '"'
+        if title:
+            s += ' title="' + escape_html(title) + '"'
+        return s + ' />'
@@ -0,0 +1,171 @@
+import json
+import os
+import shutil
+
+from zogn import conf, builders
+from zogn.depends import post_key
+from zogn.outputs import atomic_write
+from zogn.text import tokenize, plain_text
+
+INDEX_VERSION = 1
+SEARCH_FOLDER_NAME = "search"
+
+
+# 浏览器端的查询代码，分词和分片规则必须与 text.tokenize、shard_of 一致
+SEARCH_JS = r"""(function () {
+  var TOKEN_RE = /[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+/g;
+  var base = (document.currentScript && document.currentScript.src || "/search/search.js").replace(/[^/]*$/, "");
+  var meta = null, shards = {};
+
+  function tokenize(text) {
+    var terms = [], m;
+    text = text.toLowerCase();
+    while ((m = TOKEN_RE.exec(text)) !== null) {
+      var run = m[0];
+      if (run.charCodeAt(0) < 128) {
+        if (run.length > 1 || /[0-9]/.test(run)) terms.push(run);
+      } else if (run.length === 1) {
+        terms.push(run);
+      } else {
+        for (var i = 0; i < run.length - 1; i++) terms.push(run.substr(i, 2));
+      }
+    }
+    return terms.filter(function (t, i) { return terms.indexOf(t) === i; });
+  }
+
+  function load(name) {
+    return fetch(base + name).then(function (r) { return r.json(); });
+  }
+
+  function shard(i) {
+    if (!shards[i]) shards[i] = load("shard-" + i + ".json");
+    return shards[i];
+  }
+
+  window.zognSearch = function (query, limit) {
+    var terms = tokenize(query);
+    if (!terms.length) return Promise.resolve([]);
+    meta = meta || load("index.json");
+    return meta.then(function (index) {
+      return Promise.all(terms.map(function (t) {
+        return shard(t.charCodeAt(0) % index.shards).then(function (s) { return s[t] || []; });
+      })).then(function (postings) {
+        var counts = {};
+        postings.forEach(function (deltas) {
+          var id = 0;
+          deltas.forEach(function (d) { id += d; counts[id] = (counts[id] || 0) + 1; });
+        });
+        var q = query.toLowerCase();
+        return Object.keys(counts).filter(function (id) {
+          return counts[id] === terms.length && index.docs[id];
+        }).map(function (id) {
+          var doc = index.docs[id];
+          return {url: doc[0], title: doc[1], date: doc[2], score: doc[1].toLowerCase().indexOf(q) >= 0 ? 1 : 0};
+        }).sort(function (a, b) {
+          return b.score - a.score || (a.date < b.date ? 1 : -1);
+        }).slice(0, limit || 20);
+      });
+    });
+  };
+})();
+"""
+
+
+def shard_of(term, shards):
+    return ord(term[0]) % shards
+
+
+def article_terms(article):
+    text = " ".join([
+        article["title"],
+        article["category"]["name"],
+        *(tag["name"] for tag in article["tags"]),
+        plain_text(article.get("body")),
+    ])
+    return tokenize(text)
+
+
+class SearchIds:
+    """
+    文章 slug 到文档编号的映射，编号在多次构建间保持不变，新增文章不会改变其他文章所在的分片内容
+
+    删除的文章留下空位，空位超过四分之一时重新编号
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.ids = {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == INDEX_VERSION:
+                self.ids = data["ids"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def assign(self, slugs):
+        slugs_set = set(slugs)
+        ids = {slug: i for slug, i in self.ids.items() if slug in slugs_set}
+        size = max(ids.values(), default=-1) + 1
+        if size > len(slugs) and (size - len(ids)) * 4 > size:
+            ids = {}
+            size = 0
+        for slug in slugs:
+            if slug not in ids:
+                ids[slug] = size
+                size += 1
+        self.ids = ids
+        return ids, size
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        atomic_write(self.path, json.dumps({"version": INDEX_VERSION, "ids": self.ids}, ensure_ascii=False).encode("utf-8"))
+
+
+def _dumps(data):
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+
+
+def build_search(articles):
+    """
+    生成搜索索引：search/index.json 为文档列表，search/shard-<n>.json 为按词首字分片的倒排表
+
+    倒排表中的文档编号按升序做差分编码，浏览器只需下载查询词所在的分片
+    """
+    output = conf.HTML_OUTPUT_PATH / SEARCH_FOLDER_NAME
+    if not conf.SEARCH_INDEX:
+        shutil.rmtree(output, ignore_errors=True)
+        return
+    index_path = output / "index.json"
+    graph = builders.build_graph
+    if graph is not None and not graph.needs_build(index_path, list(map(post_key, articles))):
+        return
+
+    search_ids = SearchIds(str(conf.CACHE_PATH / "search-ids.json"))
+    ids, size = search_ids.assign([article["slug"] for article in articles])
+
+    docs = [None] * size
+    postings = {}
+    for article in articles:
+        doc_id = ids[article["slug"]]
+        docs[doc_id] = [article["url"], article["title"], str(article["date"])]
+        for term in article_terms(article):
+            postings.setdefault(term, []).append(doc_id)
+
+    shard_count = conf.SEARCH_SHARDS
+    shards = [{} for _ in range(shard_count)]
+    for term, doc_ids in postings.items():
+        doc_ids.sort()
+        shards[shard_of(term, shard_count)][term] = [doc_ids[0]] + [b - a for a, b in zip(doc_ids, doc_ids[1:])]
+
+    output.mkdir(parents=True, exist_ok=True)
+    builders.writer(index_path, _dumps({"version": INDEX_VERSION, "shards": shard_count, "docs": docs}))
+    for i, shard in enumerate(shards):
+        builders.writer(output / f"shard-{i}.json", _dumps(shard))
+    builders.writer(output / "search.js", SEARCH_JS)
+
+    # 减少分片数量后删除多余的分片
+    for path in output.glob("shard-*.json"):
+        if int(path.stem.split("-")[1]) >= shard_count:
+            path.unlink()
+    search_ids.save()
@@ -1,10 +1,18 @@
-from flask import Flask, Response, send_from_directory, g
-from zogn.parsers import parse_article, parse_sitemap, parse_category, parse_about, parse_index, SLUG_TO_PATH, \
-    parse_tag, load_all_articles, load_all_data, POST_DATA
+from flask import Flask, Response, send_from_directory, g, stream_with_context, request, make_response
+from zogn.parsers import parse_about, POST_DATA
 from zogn.builders import render_to_html, build_rss, Pagination
+from zogn.response_cache import LRUCache
+from zogn.compress import choose_encoding, compress_bytes, available_encodings, MIN_SIZE
+from zogn.images import build_images
+from zogn.watcher import SiteWatcher
 from zogn import conf
 
 import datetime
+import functools
+import hashlib
+import os
+import queue
+import threading
 
 app = Flask(__name__,
             template_folder=conf.TEMPLATES_FOLDER,
@@ -12,28 +20,192 @@ app = Flask(__name__,
             )
 
 app.config["img_folder_path"] = conf.IMAGE_PATH
-app.config["post_data"] = load_all_data()
+
+# 每个请求开始时取一次 site.snapshot，文件变化时整体替换，请求不会看到更新了一半的数据
+site = SiteWatcher()
+
+# 渲染结果缓存，键为请求路径和站点数据版本，数据更新后自动失效
+response_cache = LRUCache(max_items=2048, max_bytes=64 * 1024 * 1024)
+_cached_version = None
+
+LIVE_RELOAD_SCRIPT = """<script>
+new EventSource("/__livereload").onmessage = function () { location.reload(); };
+</script>"""
+
+
+def load_site(jobs=None, watch=False):
+    """
+    加载站点数据，由 server 命令在启动时显式调用，watch 为 True 时监视文件变化并自动刷新浏览器
+    """
+    snapshot = site.load(jobs)
+    _bind(snapshot)
+    if watch:
+        site.start()
+    threading.Thread(target=convert_images, args=(watch,), name="zogn-images", daemon=True).start()
+    return snapshot.post_data
+
+
+def _bind(snapshot):
+    POST_DATA.update(**snapshot.post_data)
+    conf.SITE_INDEX = snapshot.index
+    app.config["post_data"] = snapshot.post_data
+
+
+def _convert_images_in_child():
+    """
+    多进程模式下主进程中不启动线程，图片在单独的子进程中转换，由 PreforkServer 回收
+    """
+    if os.fork() == 0:
+        code = 0
+        try:
+            build_images(site.snapshot.post_data["articles"])
+        except Exception as e:
+            print(f"图片转换出错: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+
+
+def serve_workers(host, port, workers, jobs=None, watch=True):
+    """
+    多进程预览：站点数据只在主进程中加载一次，工作进程 fork 后共享
+
+    watch 为 True 时主进程检查文件变化，有变化时用新数据平滑重启工作进程；收到 SIGHUP 时重新加载全部文章
+    """
+    from zogn.prefork import PreforkServer
+
+    _bind(site.load(jobs))
+    _convert_images_in_child()
+
+    def poll():
+        if not site.poll():
+            return False
+        _bind(site.snapshot)
+        _convert_images_in_child()
+        return True
+
+    def reload():
+        _bind(site.load(jobs))
+        _convert_images_in_child()
+
+    server = PreforkServer(app, host, port, workers, poll=poll if watch else None, reload=reload)
+    server.serve_forever()
+
+
+def convert_images(watch):
+    """
+    在后台转换文章引用的图片，页面渲染不等待图片编码
+    """
+    listener = site.subscribe() if watch else None
+    while True:
+        try:
+            build_images(site.snapshot.post_data["articles"])
+        except Exception as e:
+            print(f"图片转换出错: {e}")
+        if listener is None:
+            return
+        listener.get()
+
+
+def render(template, **kwargs):
+    html = render_to_html(template, g.snapshot.post_data, **kwargs)
+    if site.watching and "</body>" in html:
+        html = html.replace("</body>", LIVE_RELOAD_SCRIPT + "</body>", 1)
+    return html
+
+
+def cached(view):
+    """
+    缓存页面的渲染结果，并根据 ETag 和 Last-Modified 处理条件请求
+    """
+
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        global _cached_version
+
+        snapshot = g.snapshot
+        if _cached_version != snapshot.version:
+            response_cache.clear()
+            _cached_version = snapshot.version
+
+        key = (request.full_path, snapshot.version, site.watching)
+        page = response_cache.get(key)
+        if page is None:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            # 压缩后的版本在首次被请求时生成并保存在同一条目中，体积远小于原文，不单独计入缓存大小
+            page = (body, response.mimetype, hashlib.sha256(body).hexdigest(), snapshot.last_modified, {})
+            response_cache.set(key, page, len(body))
+
+        body, mimetype, etag, last_modified, variants = page
+        encoding = None
+        if len(body) >= MIN_SIZE:
+            encoding = choose_encoding(request.headers.get("Accept-Encoding"), available_encodings())
+        if encoding is not None:
+            if encoding not in variants:
+                variants[encoding] = compress_bytes(body, encoding)
+            response = Response(variants[encoding], mimetype=mimetype)
+            response.content_encoding = encoding
+            response.set_etag(f"{etag}-{encoding}")
+        else:
+            response = Response(body, mimetype=mimetype)
+            response.set_etag(etag)
+        response.vary.add("Accept-Encoding")
+        response.last_modified = last_modified
+        # 浏览器每次都需要验证，内容未变化时返回 304
+        response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+    return wrapper
+
+
+@app.before_request
+def bind_snapshot():
+    g.snapshot = site.snapshot
+
+
+@app.route("/__livereload")
+def live_reload():
+    listener = site.subscribe()
+
+    def stream():
+        try:
+            while True:
+                try:
+                    version = listener.get(timeout=15)
+                except queue.Empty:
+                    # 保持连接
+                    yield ": ping\n\n"
+                    continue
+                yield f"data: {version}\n\n"
+        finally:
+            site.unsubscribe(listener)
+
+    return Response(stream_with_context(stream()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache"})
 
 
 @app.route("/")
+@cached
 def index():
-    articles = POST_DATA["articles"]
+    articles = g.snapshot.post_data["articles"]
     paginator = Pagination(articles, 10, page_tag="index")
-    return render_to_html("index.html", articles=paginator.paginate(1), page=paginator)
+    return render("index.html", articles=paginator.paginate(1), page=paginator)
     # return render_to_html("index.html", articles=articles)
 
 
 @app.route("/<slug>")
+@cached
 def detail(slug):
     if slug == "favicon.ico":
         return "", 404
 
-    articles = POST_DATA["articles"]
-    for article in articles:
-        if str(article["slug"]) == str(slug):
-            return render_to_html("post/detail.html", article=article)
-    else:
+    article = g.snapshot.index.get(slug)
+    if article is None:
         return {"error": "Not found", "code": 404}, 404
+    return render("post/detail.html", article=article)
 
 
 @app.route("/img/<path:path>")
@@ -42,89 +214,96 @@ def img(path):
 
 
 @app.route("/index-page-<int:page>")
+@cached
 def page(page):
-    articles = POST_DATA["articles"]
+    articles = g.snapshot.post_data["articles"]
     paginator = Pagination(articles, 10, page_tag="index")
-    return render_to_html("index.html", articles=paginator.paginate(page), page=paginator)
+    return render("index.html", articles=paginator.paginate(page), page=paginator)
 
 
 @app.route("/category/<name>")
+@cached
 def category(name):
-    categories = POST_DATA["categories"]
+    categories = g.snapshot.post_data["categories"]
     articles = categories.get(name) or []
     paginator = Pagination(articles, 5, page_tag=name, page_suffix="category")
-    return render_to_html("post/category.html", articles=paginator.paginate(1), category_name=name, page=paginator)
+    return render("post/category.html", articles=paginator.paginate(1), category_name=name, page=paginator)
 
 
 @app.route("/category/<name>-page-<int:page>")
+@cached
 def category_page(name, page):
-    categories = POST_DATA["categories"]
+    categories = g.snapshot.post_data["categories"]
     articles = categories.get(name) or []
     paginator = Pagination(articles, 5, page_tag=name, page_suffix="category")
-    return render_to_html("index.html", articles=paginator.paginate(page), page=paginator)
+    return render("index.html", articles=paginator.paginate(page), page=paginator)
 
 
 @app.route("/tag/<name>")
+@cached
 def tag(name):
-    tags = POST_DATA["tags"]
+    tags = g.snapshot.post_data["tags"]
     articles = tags.get(name) or []
     paginator = Pagination(articles, 5, page_tag=name, page_suffix="tag")
-    return render_to_html("post/tag.html", articles=paginator.paginate(1), tag_name=name, page=paginator)
+    return render("post/tag.html", articles=paginator.paginate(1), tag_name=name, page=paginator)
 
 
 @app.route("/tag/<name>-page-<int:page>")
+@cached
 def tag_page(name, page):
-    tags = POST_DATA["tags"]
+    tags = g.snapshot.post_data["tags"]
     articles = tags.get(name) or []
     paginator = Pagination(articles, 5, page_tag=name, page_suffix="tag")
-    return render_to_html("post/tag.html", articles=paginator.paginate(page), page=paginator, tag_name=name)
+    return render("post/tag.html", articles=paginator.paginate(page), page=paginator, tag_name=name)
 
 
 @app.route("/about")
+@cached
 def about():
     body = parse_about()
-    return render_to_html("about.html", body=body)
+    return render("about.html", body=body)
 
 
 @app.route("/archives")
+@cached
 def archives():
-    archives = POST_DATA["archives"]
-    return render_to_html("archives.html", archives=archives)
+    archives = g.snapshot.post_data["archives"]
+    return render("archives.html", archives=archives)
 
 
 @app.route("/links")
+@cached
 def links():
-    return render_to_html("links.html")
+    return render("links.html")
 
 
 @app.route("/tags")
+@cached
 def tags():
-    tags = parse_tag(load_all_articles())
+    tags = g.snapshot.index.tags
     tags = [{"name": name, "count": len(articles)} for name, articles in tags.items()]
-    return render_to_html("tags.html", tags=tags)
+    return render("tags.html", tags=tags)
 
 
 @app.route("/sitemap.xml")
+@cached
 def sitemap():
-    articles = parse_sitemap()
-    article_tags = []
-    [article_tags.append(tag) for article in articles for tag in article["tags"] if tag not in article_tags]
-
-    categories = []
-    [categories.append(article["category"]) for article in articles if article["category"] not in categories]
+    index = g.snapshot.index
     today = datetime.date.today()
-    xml = render_to_html("sitemap.xml", articles=articles, tags=article_tags, categories=categories,
-                         today=today)
+    xml = render("sitemap.xml", articles=index.articles, tags=index.tag_list,
+                         categories=index.category_list, today=today)
     return Response(xml, mimetype="application/xml")
 
 
 @app.route("/feed.xml")
+@cached
 def rss():
-    articles = POST_DATA["articles"]
+    articles = g.snapshot.post_data["articles"]
     fg = build_rss(articles)
     xml = fg.rss_str()
     return Response(xml, mimetype="application/xml")
 
 
 if __name__ == '__main__':
+    load_site()
     app.run(port=9999, debug=True, host="0.0.0.0")
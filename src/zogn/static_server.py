@@ -0,0 +1,92 @@
+import hashlib
+import mimetypes
+import os
+
+from flask import Flask, Response, abort, request, send_file
+from werkzeug.security import safe_join
+
+from zogn import conf
+from zogn.compress import choose_encoding, ENCODING_SUFFIXES
+from zogn.response_cache import LRUCache
+
+# 直接提供构建好的输出目录，与部署后的站点完全一致，不加载文章数据
+app = Flask(__name__, static_folder=None)
+
+# 不超过该大小的文件读入内存缓存，更大的文件通过 send_file 发送，由服务器决定是否使用 sendfile
+SMALL_FILE_SIZE = 64 * 1024
+
+file_cache = LRUCache(max_items=4096, max_bytes=64 * 1024 * 1024)
+
+
+def resolve(path):
+    """
+    把请求路径映射到输出目录中的文件，/slug 和 /category/x-page-2 对应 .html 文件，目录对应其中的 index.html
+    """
+    root = str(conf.HTML_OUTPUT_PATH)
+    path = path.strip("/")
+    candidates = [path, f"{path}.html", f"{path}/index.html"] if path else ["index.html"]
+    for candidate in candidates:
+        file_path = safe_join(root, candidate)
+        if file_path is not None and os.path.isfile(file_path):
+            return file_path
+    return None
+
+
+def _variant(file_path, stat):
+    """
+    根据 Accept-Encoding 选择预压缩文件，比原文件旧的压缩文件视为过期
+    """
+    available = {}
+    for encoding, suffix in ENCODING_SUFFIXES.items():
+        try:
+            variant_stat = os.stat(file_path + suffix)
+        except OSError:
+            continue
+        if variant_stat.st_mtime_ns >= stat.st_mtime_ns:
+            available[encoding] = (file_path + suffix, variant_stat)
+    if not available:
+        return None, file_path, stat
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"), tuple(available))
+    if encoding is None:
+        return None, file_path, stat
+    return (encoding, *available[encoding])
+
+
+def _cached_file(path, stat):
+    """
+    小文件的内容和 ETag，文件大小或修改时间变化时重新读取
+    """
+    key = (path, stat.st_size, stat.st_mtime_ns)
+    item = file_cache.get(key)
+    if item is None:
+        with open(path, "rb") as f:
+            data = f.read()
+        item = (data, hashlib.sha256(data).hexdigest())
+        file_cache.set(key, item, len(data))
+    return item
+
+
+@app.route("/", defaults={"path": ""})
+@app.route("/<path:path>")
+def serve(path):
+    file_path = resolve(path)
+    if file_path is None:
+        abort(404)
+    mimetype = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    encoding, send_path, stat = _variant(file_path, os.stat(file_path))
+
+    if stat.st_size <= SMALL_FILE_SIZE:
+        data, etag = _cached_file(send_path, stat)
+        response = Response(data, mimetype=mimetype)
+        response.set_etag(etag)
+        response.last_modified = stat.st_mtime
+        response.cache_control.no_cache = True
+        response = response.make_conditional(request, accept_ranges=True, complete_length=len(data))
+    else:
+        # send_file 处理 Range 和条件请求，WSGI 服务器支持时使用 sendfile
+        response = send_file(send_path, mimetype=mimetype, conditional=True, etag=True, max_age=0)
+
+    if encoding is not None:
+        response.content_encoding = encoding
+    response.vary.add("Accept-Encoding")
+    return response
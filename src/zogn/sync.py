@@ -0,0 +1,82 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def is_up_to_date(source, target):
+    try:
+        s, t = os.stat(source), os.stat(target)
+    except OSError:
+        return False
+    return s.st_size == t.st_size and s.st_mtime_ns == t.st_mtime_ns
+
+
+def _clone(source, target):
+    """
+    依次尝试硬链接、copy_file_range（支持的文件系统上为 reflink）和普通复制
+    """
+    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+    try:
+        os.link(source, tmp)
+        os.replace(tmp, target)
+        return
+    except OSError:
+        pass
+
+    try:
+        with open(source, "rb") as fsrc, open(tmp, "wb") as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+            copied = 0
+            while copied < size:
+                n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                if n == 0:
+                    break
+                copied += n
+        if copied != size:
+            raise OSError("copy_file_range incomplete")
+    except (AttributeError, OSError):
+        shutil.copyfile(source, tmp)
+    shutil.copystat(source, tmp)
+    os.replace(tmp, target)
+
+
+def sync_file(source, target):
+    if is_up_to_date(source, target):
+        return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    _clone(source, target)
+    return True
+
+
+def sync_files(pairs, target_root, jobs=None):
+    """
+    把 (源文件, 目标文件) 同步到 target_root 下，只复制新增或大小、修改时间变化的文件，并删除多余的文件
+
+    返回 (复制数, 跳过数, 删除数)
+    """
+    target_root = Path(target_root)
+    pending = [(source, target) for source, target in pairs if not is_up_to_date(source, target)]
+    for target in {target.parent for _, target in pending}:
+        target.mkdir(parents=True, exist_ok=True)
+
+    jobs = jobs or min(32, (os.cpu_count() or 1) * 4)
+    if jobs > 1 and len(pending) > 1:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            list(executor.map(lambda pair: _clone(*pair), pending))
+    else:
+        for source, target in pending:
+            _clone(source, target)
+
+    removed = 0
+    targets = {Path(target) for _, target in pairs}
+    for root, dirs, files in os.walk(target_root, topdown=False):
+        for file in files:
+            path = Path(root, file)
+            if path not in targets:
+                path.unlink()
+                removed += 1
+        if root != str(target_root) and not os.listdir(root):
+            os.rmdir(root)
+
+    return len(pending), len(pairs) - len(pending), removed
@@ -0,0 +1,36 @@
+import html
+import re
+
+# 英文和数字按单词切分，中日韩文字按相邻两个字切分（单独的一个字保留为一个词）
+_TOKEN_RE = re.compile(r"[a-z0-9]+|[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+")
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+def split_terms(text):
+    """
+    返回文本中的所有词，包括重复的词
+    """
+    terms = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if run.isascii():
+            if len(run) > 1 or run.isdigit():
+                terms.append(run)
+        elif len(run) <= 2:
+            terms.append(run)
+        else:
+            terms.extend([run[i:i + 2] for i in range(len(run) - 1)])
+    return terms
+
+
+def tokenize(text):
+    """
+    返回文本中去重后的词，保持首次出现的顺序
+    """
+    return list(dict.fromkeys(split_terms(text)))
+
+
+def plain_text(body):
+    """
+    去掉 HTML 标签，得到渲染后正文的纯文本
+    """
+    return html.unescape(_TAG_RE.sub(" ", body or ""))
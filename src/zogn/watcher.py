@@ -0,0 +1,241 @@
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from zogn import conf
+from zogn.parsers import load_markdown_folders, load_markdown_file, build_site_data, neighbour_fields, site_data, \
+    SLUG_TO_PATH
+from zogn.related import related_lists
+
+
+class SiteSnapshot:
+    """
+    某一时刻的站点数据，生成后不再修改，更新时整体替换引用
+    """
+
+    def __init__(self, post_data, index, version, last_modified):
+        self.post_data = post_data
+        self.index = index
+        self.version = version
+        # 所有源文件中最新的修改时间
+        self.last_modified = last_modified
+
+
+class SiteWatcher:
+    """
+    预览服务器使用的站点数据，监视内容和主题目录，文件变化时只重新解析变化的文章
+
+    新的快照在上一个快照的基础上生成：只替换变化的文章、上一篇/下一篇或相关文章变化的文章（复制后修改，
+    旧快照中的文章保持不变），只重新排列这些文章所在的分类、标签和月份，结果与重新加载完全一致。
+    相关文章仍对全部文章调用 compute_related，内容没有变化的文章直接使用缓存
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.snapshot = None
+        self.folders = (conf.POST_PATH, conf.DAILY_PATH)
+        # 目录 -> {路径: 解析结果}，保持文件遍历顺序，草稿为 None
+        self.sources = {folder: {} for folder in self.folders}
+        # 路径 -> 当前快照中的文章
+        self.published = {}
+        self.mtimes = {}
+        self._listeners = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def watching(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def load(self, jobs=None):
+        for folder, items in load_markdown_folders(self.folders, jobs).items():
+            self.sources[folder] = dict(items)
+        self.mtimes = self.scan()
+        self._publish()
+        return self.snapshot
+
+    def _paths(self):
+        # 与 load_folder 相同的顺序：按目录和文件遍历顺序
+        for folder in self.folders:
+            for path, metadata in self.sources[folder].items():
+                if metadata is not None:
+                    yield path, metadata
+
+    def _publish(self):
+        # 复制一份再写入上一篇/下一篇，源数据保持不变
+        self.published = {path: dict(metadata) for path, metadata in self._paths()}
+        articles = []
+        for folder in self.folders:
+            items = [self.published[path] for path in self.sources[folder] if path in self.published]
+            items.sort(key=lambda x: x["date"], reverse=True)
+            articles.extend(items)
+
+        SLUG_TO_PATH.clear()
+        SLUG_TO_PATH.update((metadata["slug"], path.as_posix()) for path, metadata in self._paths())
+        post_data, index = build_site_data(articles)
+        self._set_snapshot(post_data, index)
+
+    def _patch(self, paths):
+        """
+        在当前快照的基础上更新 paths 中变化的文章
+        """
+        previous = self.snapshot.index
+        published = dict(self.published)
+        stale = {}
+        for path in paths:
+            article = published.pop(path, None)
+            if article is not None:
+                stale[id(article)] = article
+                if SLUG_TO_PATH.get(article["slug"]) == path.as_posix():
+                    del SLUG_TO_PATH[article["slug"]]
+
+        path_of = {id(article): path for path, article in published.items()}
+        articles = [article for article in previous.articles if id(article) not in stale]
+        order = [path_of[id(article)] for article in articles]
+        # 日期倒序，日期相同时按目录和文件遍历顺序，与 _publish 中两次稳定排序的结果相同
+        rank = {path: i for i, (path, _) in enumerate(self._paths())}
+        fresh = {}
+        for path, metadata in self._paths():
+            if path in published:
+                continue
+            article = published[path] = fresh[id(article)] = dict(metadata)
+            SLUG_TO_PATH[metadata["slug"]] = path.as_posix()
+            lo, hi = 0, len(articles)
+            while lo < hi:
+                mid = (lo + hi) // 2
+                other = articles[mid]
+                if other["date"] > article["date"] or (other["date"] == article["date"] and rank[order[mid]] < rank[path]):
+                    lo = mid + 1
+                else:
+                    hi = mid
+            articles.insert(lo, article)
+            order.insert(lo, path)
+
+        removed, added = list(stale.values()), list(fresh.values())
+
+        def writable(position):
+            # 旧快照中的文章复制后再修改
+            article = articles[position]
+            if id(article) not in fresh:
+                removed.append(article)
+                article = articles[position] = published[order[position]] = fresh[id(article)] = dict(article)
+                added.append(article)
+            return article
+
+        # 上一篇/下一篇只可能在新文章和被删除文章原来的前后两篇上变化
+        position = {id(article): i for i, article in enumerate(articles)}
+        touched = set()
+        for article in added:
+            touched.update(range(position[id(article)] - 1, position[id(article)] + 2))
+        for i, article in enumerate(previous.articles):
+            if id(article) in stale:
+                touched.update(position[id(other)] for other in previous.articles[max(i - 1, 0):i + 2]
+                               if id(other) in position)
+        for i in sorted(touched):
+            if not 0 <= i < len(articles):
+                continue
+            fields = neighbour_fields(articles, i)
+            if any(articles[i].get(key) != fields.get(key) for key in ("prev_article", "next_article")):
+                article = writable(i)
+                article.pop("prev_article", None)
+                article.pop("next_article", None)
+                article.update(fields)
+        related = related_lists(articles)
+        if related is not None:
+            for i, article in enumerate(articles):
+                if article.get("related") != related[article["slug"]]:
+                    writable(i)["related"] = related[article["slug"]]
+
+        index = previous.patch(articles, removed, added)
+        self.published = published
+        self._set_snapshot(site_data(index), index)
+
+    def _set_snapshot(self, post_data, index):
+        version = self.snapshot.version + 1 if self.snapshot else 1
+        last_modified = datetime.fromtimestamp(max(self.mtimes.values(), default=0) // 10 ** 9, tz=timezone.utc)
+        self.snapshot = SiteSnapshot(post_data, index, version, last_modified)
+
+    def scan(self):
+        mtimes = {}
+        for root in (conf.CONTENT_PATH, conf.TEMPLATES_FOLDER, conf.STATIC_FOLDER):
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        mtimes[Path(path)] = os.stat(path).st_mtime_ns
+                    except OSError:
+                        continue
+        return mtimes
+
+    def poll(self):
+        """
+        检查一次文件变化，有变化时生成新的快照并通知浏览器刷新
+        """
+        mtimes = self.scan()
+        if mtimes == self.mtimes:
+            return False
+
+        changed = {p for p, mtime in mtimes.items() if self.mtimes.get(p) != mtime}
+        changed.update(set(self.mtimes) - set(mtimes))
+        self.mtimes = mtimes
+
+        start = time.perf_counter()
+        updated = set()
+        for folder in self.folders:
+            sources = self.sources[folder]
+            for path in changed:
+                if path.suffix != ".md" or folder not in path.parents:
+                    continue
+                if path not in mtimes:
+                    if sources.pop(path, None) is not None:
+                        updated.add(path)
+                    continue
+                try:
+                    metadata = load_markdown_file(path)
+                except Exception as e:
+                    # 编辑器保存到一半时可能无法解析，保留旧的内容
+                    print(f"解析失败 {path}: {e}")
+                    continue
+                sources[path] = metadata
+                updated.add(path)
+
+        if updated:
+            self._patch(updated)
+        else:
+            # 只有模板或静态文件变化时沿用站点数据，版本号变化使页面缓存失效
+            self._set_snapshot(self.snapshot.post_data, self.snapshot.index)
+        print(f"已更新 {len(changed)} 个文件，用时 {(time.perf_counter() - start) * 1000:.0f}ms")
+        self._notify(self.snapshot.version)
+        return True
+
+    def subscribe(self):
+        listener = queue.Queue()
+        self._listeners.add(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        self._listeners.discard(listener)
+
+    def _notify(self, version):
+        for listener in list(self._listeners):
+            listener.put(version)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"监视文件变化出错: {e}")
+
+    def start(self):
+        if self.watching:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="zogn-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()